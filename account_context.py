@@ -0,0 +1,104 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# Invoices are duck-typed: anything with invoice_id, due_date, amount and status
+# (the `Invoice` model in 05_advanced_deps_struct_response.ipynb)
+PAID = "paid"
+
+
+@dataclass
+class InvoicePage:
+    """One page of invoices returned to the model by a tool."""
+    invoices: List[Any]
+    page: int
+    total_pages: int
+    total: int
+
+
+class InvoiceIndex:
+    """Invoices grouped by status and sorted by due date, built once per account.
+
+    Statuses are matched case-insensitively. Invoices without a due date sort last.
+    """
+
+    def __init__(self, invoices: Iterable[Any]):
+        unique = {invoice.invoice_id: invoice for invoice in invoices}
+        self.invoices = sorted(unique.values(), key=self._due_key)
+        self.by_status: Dict[str, List[Any]] = {}
+        for invoice in self.invoices:
+            self.by_status.setdefault(invoice.status.lower(), []).append(invoice)
+        # Unpaid invoices with a due date, oldest first, for bisecting on "today"
+        self._unpaid_due = [i for i in self.invoices if i.status.lower() != PAID and i.due_date is not None]
+        self._unpaid_due_dates = [i.due_date for i in self._unpaid_due]
+
+    @staticmethod
+    def _due_key(invoice: Any):
+        return (invoice.due_date is None, invoice.due_date or date.min, invoice.invoice_id)
+
+    @classmethod
+    def from_account(cls, account: Any) -> "InvoiceIndex":
+        return cls([*(account.recent_invoices or []), *(account.outstanding_invoices or [])])
+
+    def counts(self) -> Dict[str, int]:
+        return {status: len(items) for status, items in self.by_status.items()}
+
+    def totals(self) -> Dict[str, float]:
+        return {status: round(sum(i.amount for i in items), 2) for status, items in self.by_status.items()}
+
+    def overdue(self, today: Optional[date] = None, limit: Optional[int] = None) -> List[Any]:
+        """Unpaid invoices due before `today`, most overdue first."""
+        today = today or date.today()
+        end = bisect_left(self._unpaid_due_dates, today)
+        return self._unpaid_due[:end if limit is None else min(end, limit)]
+
+    def overdue_count(self, today: Optional[date] = None) -> int:
+        return bisect_left(self._unpaid_due_dates, today or date.today())
+
+    def page(self, status: Optional[str] = None, page: int = 1, page_size: int = 20) -> InvoicePage:
+        """Invoices (optionally of one status) ordered by due date, `page_size` at a time."""
+        if status is None:
+            items = self.invoices
+        elif status.lower() == "overdue":
+            items = self._unpaid_due[:self.overdue_count()]
+        else:
+            items = self.by_status.get(status.lower(), [])
+        page = max(1, page)
+        start = (page - 1) * page_size
+        total_pages = max(1, -(-len(items) // page_size))
+        return InvoicePage(items[start:start + page_size], page, total_pages, len(items))
+
+
+def compact_account_context(
+    account: Any,
+    index: InvoiceIndex,
+    today: Optional[date] = None,
+    top_k: int = 5,
+) -> str:
+    """A bounded summary of the account for the system prompt.
+
+    Its size depends on the number of statuses and `top_k`, not on the number of invoices;
+    full invoice details are left to a paginated tool.
+    """
+    today = today or date.today()
+    counts, totals = index.counts(), index.totals()
+    by_status = "; ".join(
+        f"{status.title()}: {counts[status]} (${totals[status]:,.2f})" for status in sorted(counts)
+    ) or "none"
+    overdue = index.overdue(today, limit=top_k)
+    overdue_count = index.overdue_count(today)
+    lines = [
+        f"Customer account {account.account_id}: {account.customer_name} <{account.email}>.",
+        f"Invoices as of {today.isoformat()}: {len(index.invoices)} total. By status: {by_status}.",
+        f"Overdue (unpaid and past due): {overdue_count}.",
+    ]
+    if overdue:
+        shown = ", ".join(
+            f"{i.invoice_id} ${i.amount:,.2f} due {i.due_date.isoformat()} ({i.status})" for i in overdue
+        )
+        more = f" and {overdue_count - len(overdue)} more" if overdue_count > len(overdue) else ""
+        lines.append(f"Most overdue: {shown}{more}.")
+    lines.append("Use the list_invoices tool for full invoice details.")
+    return "\n".join(lines)
@@ -1,19 +1,26 @@
 from pydantic_ai import Agent, RunContext, Tool
-from pydantic_ai.models.ollama import OllamaModel
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from pydantic_ai.usage import Usage
+from typing import Optional, List, Tuple
+from dataclasses import dataclass, field
+import asyncio
 
 
-
-import nest_asyncio
-nest_asyncio.apply()
-
-model = OllamaModel(
-    model_name='qwen2.5:7b',
-    base_url='http://localhost:11434/v1/',
-)
+from response_cache import CachedModel
+from output_repair import RepairingModel, format_stats
+from admission import AdmittedModel, Priority, priority
+from checkpoint import CheckpointJournal, checkpointed
+from model_pool import ModelPool
+from prompt_templates import PromptTemplate
+from instrumentation import instrument_from_env
+import runtime
 
 
+# OLLAMA_BASE_URLS=url1,url2,... spreads requests over several replicas (default: localhost);
+# results that narrowly fail validation are repaired locally instead of regenerated
+base_model = RepairingModel(AdmittedModel(ModelPool.from_env('qwen2.5:7b')))
+# Identical requests (same prompt, deps and result schema) are served from the response cache
+model = CachedModel(base_model)
 
 
 ### models ####
@@ -53,16 +60,26 @@ benefit_agent = Agent(
     deps_type=ProductDescription,
 )
 
+# Fixed instructions first, deps last, so every run shares the same prompt prefix
+BENEFIT_PROMPT = PromptTemplate(
+    "Generate a list of consumer benefits for the following product/service description: "
+    "{product_or_service_description}"
+)
+
+CREATIVE_PROMPT = PromptTemplate("""
+    You are a master offer creator. Your task is to craft an irresistible offer that compels the target audience to take action.
+    Generate ad creatives for the following product/service: {product_or_service_description}
+    Find innovative ways to present these benefits to the target audience: {consumer_benefits}
+""")
+
 @benefit_agent.system_prompt
 async def benefit_system_prompt(ctx: RunContext[ProductDescription]) -> str:
     """Generates a system prompt using dependency data."""
-    product_or_service_description = ctx.deps.product_or_service_description
-    return (
-        f"""Generate a list of consumer benefits for the following product/service description: {product_or_service_description}"""
-    )
+    return BENEFIT_PROMPT.render_from(ctx.deps)
 
+# Not cached: the refinement loop relies on getting a fresh creative on every iteration
 creative_agent = Agent(
-    model=model,
+    model=base_model,
     retries=2,
     result_type=AdCreativeOutput,
     deps_type=AdCreativeInput,
@@ -71,15 +88,7 @@ creative_agent = Agent(
 @creative_agent.system_prompt
 async def creative_system_prompt(ctx: RunContext[AdCreativeInput]) -> str:
     """Generates a system prompt using dependency data."""
-    product_or_service_description = ctx.deps.product_or_service_description  # Use description
-    consumer_benefits = ctx.deps.consumer_benefits
-    return (
-        f"""
-        You are a master offer creator. Your task is to craft an irresistible offer that compels the target audience to take action.
-        Generate ad creatives for the following product/service: {product_or_service_description}
-        Find innovative ways to present these benefits to the target audience: {consumer_benefits}
-        """
-    )
+    return CREATIVE_PROMPT.render_from(ctx.deps)
 
 evaluator_agent = Agent(
     model=model,
@@ -96,41 +105,182 @@ async def evaluator_system_prompt(ctx: RunContext[EvaluatorInput]) -> str:
         f"Evaluate the following ad creative: {ad_creative}"
     )
 
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(
+    benefit_agent=benefit_agent,
+    creative_agent=creative_agent,
+    evaluator_agent=evaluator_agent,
+)
+
+### tournament mode ####
+@dataclass
+class TournamentBudget:
+    """Limits that stop the refinement loop from running away."""
+    max_rounds: int = 5  # Rounds of `candidates` creatives each
+    max_tokens: Optional[int] = None  # Total tokens across all creative and evaluator runs
+
+
+@dataclass
+class TournamentResult:
+    """Best creative found, and whether it cleared the threshold."""
+    creative: Optional[AdCreativeOutput]
+    evaluation: Optional[EvaluatorOutput]
+    passed: bool
+    rounds: int
+    tokens_used: int  # Includes the tokens spent by candidates that failed
+    failures: List[BaseException] = field(default_factory=list)  # Candidates that raised instead of scoring
+
+
+async def score_candidate(
+    product_info: AdCreativeInput,
+    journal: Optional[CheckpointJournal] = None,
+    stage: str = "candidate",
+    usage: Optional[Usage] = None,
+) -> Tuple[AdCreativeOutput, EvaluatorOutput, int]:
+    """Generate one creative and evaluate it; returns the tokens both runs used.
+
+    Both runs add to `usage` as they go, so a caller can still count the tokens of a candidate
+    that raised. With a `journal`, both results are recorded under `stage`, and a resumed run
+    takes them from it without spending tokens.
+    """
+    usage = usage if usage is not None else Usage()
+
+    async def generate() -> AdCreativeOutput:
+        result = await creative_agent.run(user_prompt="Generate ad creative", deps=product_info, usage=usage)
+        return result.data
+
+    async def evaluate() -> EvaluatorOutput:
+        result = await evaluator_agent.run(
+            user_prompt="Evaluate ad creative",
+            deps=EvaluatorInput(ad_creative=ad_creative),
+            usage=usage,
+        )
+        return result.data
+
+    ad_creative = await checkpointed(journal, product_info, f"{stage}/creative", AdCreativeOutput, generate)
+    evaluation = await checkpointed(journal, product_info, f"{stage}/evaluation", EvaluatorOutput, evaluate)
+    creative = ad_creative.model_copy(update={"score": evaluation.score})
+    return creative, evaluation, usage.total_tokens or 0
+
+
+async def run_tournament(
+    product_info: AdCreativeInput,
+    threshold: int = 9,
+    candidates: int = 3,
+    budget: Optional[TournamentBudget] = None,
+    journal: Optional[CheckpointJournal] = None,
+) -> TournamentResult:
+    """Generate and evaluate `candidates` creatives concurrently per round.
+
+    Stops as soon as any candidate reaches `threshold`, cancelling the ones still in flight,
+    or when the round/token budget runs out. Tokens of cancelled runs are not counted; those of
+    failed runs are, and the failures are listed in the result. With a `journal`, candidates
+    finished before a crash are replayed from it.
+    """
+    budget = budget or TournamentBudget()
+    best: Optional[Tuple[AdCreativeOutput, EvaluatorOutput]] = None
+    tokens_used = 0
+    failures: List[BaseException] = []
+    rounds = 0
+    while rounds < budget.max_rounds:
+        rounds += 1
+        # Candidates are speculative work, so they yield to interactive requests for the model server
+        with priority(Priority.BATCH):
+            usages = {}
+            for i in range(candidates):
+                usage = Usage()
+                task = asyncio.create_task(score_candidate(product_info, journal, f"round-{rounds}/candidate-{i}", usage))
+                usages[task] = usage
+            pending = set(usages)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tokens_used += usages[task].total_tokens or 0
+                    if task.exception() is not None:
+                        failures.append(task.exception())  # A failed candidate drops out of the round
+                        continue
+                    creative, evaluation, _ = task.result()
+                    if best is None or evaluation.score > best[1].score:
+                        best = (creative, evaluation)
+                if best is not None and best[1].score >= threshold:
+                    return TournamentResult(*best, passed=True, rounds=rounds, tokens_used=tokens_used, failures=failures)
+                if budget.max_tokens is not None and tokens_used >= budget.max_tokens:
+                    return TournamentResult(*(best or (None, None)), passed=False, rounds=rounds, tokens_used=tokens_used, failures=failures)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+    return TournamentResult(*(best or (None, None)), passed=False, rounds=rounds, tokens_used=tokens_used, failures=failures)
+
+
 ###################################
 # Example usage
 product_description = "an no code tool to bui8ld better workflows."
+# Number of creatives generated concurrently per round; 0 runs the original one-at-a-time loop
+TOURNAMENT_CANDIDATES = 3
+MAX_ITERATIONS = 10
+# Set CHECKPOINT_DIR to journal each finished step, so a restarted run resumes where it stopped
+journal = CheckpointJournal.from_env("ad_recursive")
 ###################################
 
 def print_markdown(label, message):
     """Formats and prints the output in Markdown style."""
     print(f"### {label}\n{message}\n")
 
-# Generate consumer benefits
-benefits_output = benefit_agent.run_sync(
-    user_prompt="Generate consumer benefits. Focus on the top 3 emotional and monetary benefits that will make this persons life better.",
-    deps=ProductDescription(product_or_service_description=product_description)
-)
-consumer_benefits = benefits_output.data.consumer_benefits
-print_markdown("Consumer Benefits", consumer_benefits)  # Print intermediate output
 
-product_info = AdCreativeInput(
-    product_or_service_description=product_description,  # Use description here
-    consumer_benefits=consumer_benefits
-)
-threshold = 9
+async def main():
+    try:
+        # Generate consumer benefits
+        async def generate_benefits() -> BenefitGenerationOutput:
+            benefits_output = await benefit_agent.run(
+                user_prompt="Generate consumer benefits. Focus on the top 3 emotional and monetary benefits that will make this persons life better.",
+                deps=ProductDescription(product_or_service_description=product_description)
+            )
+            return benefits_output.data
 
-current_score = 0
-while current_score < threshold:
-    ad_creative = creative_agent.run_sync(
-        user_prompt="Generate ad creative",
-        deps=product_info
-    )
-    print_markdown("Ad Creative", ad_creative.data)  # Print intermediate output
+        benefits = await checkpointed(journal, product_description, "benefits", BenefitGenerationOutput, generate_benefits)
+        consumer_benefits = benefits.consumer_benefits
+        print_markdown("Consumer Benefits", consumer_benefits)  # Print intermediate output
 
-    evaluation = evaluator_agent.run_sync(
-        user_prompt="Evaluate ad creative",
-        deps=EvaluatorInput(ad_creative=ad_creative.data)
-    )
-    current_score = evaluation.data.score
-    print_markdown("Evaluation", evaluation.data.evaluation)  # Print evaluation output
-    print_markdown("Score", str(current_score))  # Print score output
\ No newline at end of file
+        product_info = AdCreativeInput(
+            product_or_service_description=product_description,  # Use description here
+            consumer_benefits=consumer_benefits
+        )
+        threshold = 9
+
+        if TOURNAMENT_CANDIDATES:
+            outcome = await run_tournament(
+                product_info,
+                threshold=threshold,
+                candidates=TOURNAMENT_CANDIDATES,
+                budget=TournamentBudget(max_rounds=MAX_ITERATIONS),
+                journal=journal,
+            )
+            print_markdown("Ad Creative", outcome.creative)
+            print_markdown("Evaluation", outcome.evaluation.evaluation if outcome.evaluation else None)
+            print_markdown("Score", f"{outcome.creative.score if outcome.creative else None} (passed: {outcome.passed}, rounds: {outcome.rounds}, tokens: {outcome.tokens_used})")
+        else:
+            current_score = 0
+            iteration = 0
+            while current_score < threshold and iteration < MAX_ITERATIONS:
+                iteration += 1
+                ad_creative, evaluation, _ = await score_candidate(product_info, journal, f"iteration-{iteration}")
+                print_markdown("Ad Creative", ad_creative)  # Print intermediate output
+
+                current_score = evaluation.score
+                print_markdown("Evaluation", evaluation.evaluation)  # Print evaluation output
+                print_markdown("Score", str(current_score))  # Print score output
+
+        print_markdown("Response Cache", model.cache.stats)
+        print_markdown("Output Repairs", format_stats(base_model.stats))
+        if journal is not None:
+            print_markdown("Checkpoints", journal.stats)
+            journal.complete()  # Finished, so the next run generates a fresh ad instead of replaying this one
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+if __name__ == "__main__":
+    runtime.run(main())
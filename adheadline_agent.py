@@ -1,90 +1,160 @@
-from pydantic_ai.models.ollama import OllamaModel
-from dataclasses import dataclass
-from pydantic_ai import Agent, RunContext
+from pydantic import BaseModel, Field
+from pydantic_ai import Agent
+from typing import List
 
-@dataclass
-class MarketingDeps:
-    product_description: str
-    benefits: list[str] = None
-    hypotheses: list[str] = None
+from response_cache import CachedModel
+from admission import AdmittedModel, Priority, priority
+from model_pool import ModelPool
+from stage_graph import StageGraph
+from instrumentation import instrument_from_env
+import runtime
 
 
+# OLLAMA_BASE_URLS=url1,url2,... spreads requests over several replicas (default: localhost)
+base_model = AdmittedModel(ModelPool.from_env('qwen2.5:7b'))
+model = CachedModel(base_model)
 
-model = OllamaModel(
-    model_name='qwen2.5:7b',  
-    base_url='http://localhost:11434/v1/',  
-)
+# Products in flight at once; each stage's agent handles at most STAGE_CONCURRENCY of them
+MAX_IN_FLIGHT = 8
+STAGE_CONCURRENCY = 4
 
-#### Agent Definition
 
-marketing_agent = Agent(
-    model=model,
-    deps_type=MarketingDeps,
-    system_prompt="Your task is to create a marketing ad headline in 4 steps.",
-    result_type=dict,  # Final output will include all stages
-)
+#### Typed results passed between stages
 
-#### Stages and Tools
-#Define stages using PydanticAI's system prompt customization.
+class ProductSummary(BaseModel):
+    """Stage 1 output."""
+    description: str = Field(description="Structured, concise description of the product or service")
 
-##1. **Stage 1: Understand the Product/Service**
+class Benefits(BaseModel):
+    """Stage 2 output."""
+    benefits: List[str] = Field(description="Top 5 benefits to the end user")
 
-@marketing_agent.system_prompt
-async def describe_product(ctx: RunContext[MarketingDeps]) -> str:
-    return (
-        "You are a marketing expert. Start by understanding the product or service "
-        f"based on this input: {ctx.deps.product_description}. "
-        "Provide a structured and concise description."
-    )
+class Hypotheses(BaseModel):
+    """Stage 3 output."""
+    hypotheses: List[str] = Field(description="3 imaginative hypotheses to draw customer interest")
 
+class Headline(BaseModel):
+    headline: str
+    supporting_copy: str
 
-#2. **Stage 2: List Benefits**
+class Headlines(BaseModel):
+    """Stage 4 output."""
+    headlines: List[Headline]
+
+
+#### Agent Definitions
+# One agent per stage, so each stage has its own instructions and result type
 
-@marketing_agent.tool
-async def list_benefits(ctx: RunContext[MarketingDeps]) -> list[str]:
-    return (
+describe_agent = Agent(
+    model=model,
+    result_type=ProductSummary,
+    system_prompt=(
+        "You are a marketing expert. Start by understanding the product or service "
+        "you are given. Provide a structured and concise description."
+    ),
+)
+
+benefits_agent = Agent(
+    model=model,
+    result_type=Benefits,
+    system_prompt=(
         "Based on the product description, list the top 5 benefits to the end user. "
         "Keep the benefits concise and focused."
-    )
-
-#3. **Stage 3: Generate Hypotheses**
+    ),
+)
 
-@marketing_agent.tool
-async def generate_hypotheses(ctx: RunContext[MarketingDeps]) -> list[str]:
-    return (
+hypotheses_agent = Agent(
+    model=model,
+    result_type=Hypotheses,
+    system_prompt=(
         "Use the product benefits to create 3 imaginative and engaging hypotheses "
         "to draw customer interest. Ensure they appeal to the target audience."
-    )
-
-
-#4. **Stage 4: Refine Outputs**
+    ),
+)
 
-@marketing_agent.tool
-async def refine_outputs(ctx: RunContext[MarketingDeps]) -> list[str]:
-    return (
+refine_agent = Agent(
+    model=model,
+    result_type=Headlines,
+    system_prompt=(
         "Given the product description, benefits, and hypotheses, refine them into "
         "3 polished marketing headlines with short supporting copy for each. "
         "Make sure they are compelling and professional."
-    )
-
+    ),
+)
 
-#### Running the Agent
-#Use an async workflow to process inputs through each stage:
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(
+    describe_agent=describe_agent,
+    benefits_agent=benefits_agent,
+    hypotheses_agent=hypotheses_agent,
+    refine_agent=refine_agent,
+)
 
-description = "An wearable glucose monitor."
-deps = MarketingDeps(product_description=description)
 
-    # Stage 1: Describe the product
-await marketing_agent.run("Describe the product.", deps=deps)
+#### Stages
+# Each stage declares its inputs by parameter name and produces one named value
 
-    # Stage 2: List benefits
-deps.benefits = await marketing_agent.run("List benefits.", deps=deps)
+headline_graph = StageGraph(inputs=["product_description"])
 
-    # Stage 3: Generate hypotheses
-deps.hypotheses = await marketing_agent.run("Generate hypotheses.", deps=deps)
+##1. **Stage 1: Understand the Product/Service**
+@headline_graph.stage(output="summary", concurrency=STAGE_CONCURRENCY)
+async def describe_product(product_description: str) -> ProductSummary:
+    result = await describe_agent.run(f"Product or service: {product_description}")
+    return result.data
 
-    # Stage 4: Refine outputs
-final_outputs = await marketing_agent.run("Refine outputs.", deps=deps)
+#2. **Stage 2: List Benefits**
+@headline_graph.stage(output="benefits", concurrency=STAGE_CONCURRENCY)
+async def list_benefits(summary: ProductSummary) -> Benefits:
+    result = await benefits_agent.run(f"Product description: {summary.description}")
+    return result.data
 
-print(final_outputs)
+#3. **Stage 3: Generate Hypotheses**
+@headline_graph.stage(output="hypotheses", concurrency=STAGE_CONCURRENCY)
+async def generate_hypotheses(summary: ProductSummary, benefits: Benefits) -> Hypotheses:
+    result = await hypotheses_agent.run(
+        f"Product description: {summary.description}\nBenefits: {benefits.benefits}"
+    )
+    return result.data
 
+#4. **Stage 4: Refine Outputs**
+@headline_graph.stage(output="headlines", concurrency=STAGE_CONCURRENCY)
+async def refine_outputs(summary: ProductSummary, benefits: Benefits, hypotheses: Hypotheses) -> Headlines:
+    result = await refine_agent.run(
+        f"Product description: {summary.description}\n"
+        f"Benefits: {benefits.benefits}\n"
+        f"Hypotheses: {hypotheses.hypotheses}"
+    )
+    return result.data
+
+
+async def generate_headlines(product_description: str) -> Headlines:
+    """Run the four stages for a single product."""
+    values = await headline_graph.run({"product_description": product_description})
+    return values["headlines"]
+
+
+#### Running the Pipeline
+# Products flow through the stages concurrently, so model calls for different products overlap
+
+async def main():
+    catalog = [
+        "An wearable glucose monitor.",
+        "A noise-cancelling sleep mask.",
+        "A subscription service for locally roasted coffee.",
+    ]
+    # A catalog run is a batch sweep: it yields to interactive requests for the model server
+    with priority(Priority.BATCH):
+        summary = await headline_graph.run_many(
+            [{"product_description": description} for description in catalog],
+            max_concurrency=MAX_IN_FLIGHT,
+        )
+    for item in summary.results:
+        print(item.item["product_description"])
+        for headline in item.result["headlines"].headlines:
+            print(f"  {headline.headline} - {headline.supporting_copy}")
+    for failure in summary.failures:
+        print(f"Failed: {failure.item['product_description']}: {failure.error!r}")
+
+
+if __name__ == "__main__":
+    runtime.run(main())
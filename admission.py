@@ -0,0 +1,355 @@
+"""Admission control in front of the model server: rate limits, adaptive concurrency, priorities.
+
+Without backpressure, a batch sweep, a tournament round and a few support sessions can all hit
+Ollama at the same moment. Latency then spikes for everyone and requests start timing out.
+`AdmittedModel` wraps a model so that every request first passes a shared `AdmissionController`:
+
+    controller = AdmissionController.from_env()   # or shared_controller()
+    model = CachedModel(AdmittedModel(ModelPool.from_env("qwen2.5:7b"), controller))
+
+    with priority(Priority.BATCH):                 # runs (and tasks) started here queue behind
+        await process_datasets_in_parallel(datasets)   # interactive and normal requests
+
+A request is admitted when a concurrency slot is free and both token buckets (requests per
+second and estimated tokens per second) can cover it. Waiting requests are served highest
+priority first, then first come, first served. The concurrency limit adapts AIMD-style. A request
+that completes without slowing down raises the limit by about one per round trip. An error, or a
+latency per token well above the best recently seen, halves it, at most once per cooldown.
+Estimated tokens are reconciled with the server-reported usage when the response arrives.
+"""
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models import AgentModel, EitherStreamedResponse, Model
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.usage import Usage
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # A person is waiting on the answer (support sessions)
+    NORMAL = 1
+    BATCH = 2  # Sweeps and tournaments; they yield to everything else
+
+
+request_priority: ContextVar[Priority] = ContextVar("request_priority", default=Priority.NORMAL)
+
+
+@contextmanager
+def priority(level: Priority) -> Iterator[None]:
+    """Run model requests made in this block, and in tasks created in it, at `level`."""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+# Completion tokens assumed for a request that doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+
+def estimate_request_tokens(messages: List[ModelMessage], model_settings: Optional[ModelSettings]) -> int:
+    """Prompt tokens (4 characters per token) plus the completion budget."""
+    completion = (model_settings or {}).get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return len(ModelMessagesTypeAdapter.dump_json(messages)) // 4 + completion
+
+
+class TokenBucket:
+    """`rate` units per second, bursting up to `capacity`; the level may go negative (debt)."""
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else (rate or 0.0)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.rate is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if now). Requests above capacity only need a full bucket."""
+        if self.rate is None:
+            return 0.0
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        return 0.0 if self.level >= needed else (needed - self.level) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        if self.rate is not None:
+            self._refill(now)
+            self.level -= amount
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    queued: int = 0  # Requests that had to wait for admission
+    wait_seconds: float = 0.0
+    errors: int = 0
+    increases: int = 0
+    decreases: int = 0
+    limit: float = 0.0  # Current concurrency limit
+    by_priority: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    loop: asyncio.AbstractEventLoop = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class AdmissionController:
+    """Token buckets plus an AIMD concurrency limit, with a priority queue of waiting requests.
+
+    Thread-safe and usable from several event loops at once (e.g. a script's loop and the
+    runtime's background loop): the limits are process-wide.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        tokens_per_second: Optional[float] = None,
+        burst_seconds: float = 2.0,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        initial_concurrency: int = 4,
+        latency_tolerance: float = 2.0,
+        decrease_cooldown: float = 1.0,
+    ):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_tolerance = latency_tolerance
+        self.decrease_cooldown = decrease_cooldown
+        self.requests = TokenBucket(
+            requests_per_second, requests_per_second * burst_seconds if requests_per_second else None
+        )
+        self.tokens = TokenBucket(tokens_per_second, tokens_per_second * burst_seconds if tokens_per_second else None)
+        # Within bounds from the start, so e.g. MODEL_MAX_CONCURRENCY=1 holds before any decrease
+        self.limit = float(min(max(initial_concurrency, min_concurrency), max_concurrency))
+        self.in_flight = 0
+        self.stats = AdmissionStats(limit=self.limit)
+        self._baseline: Optional[float] = None  # Best recent seconds per token
+        self._last_decrease = 0.0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    @classmethod
+    def from_env(cls, **kwargs: Any) -> "AdmissionController":
+        """Limits from MODEL_MAX_RPS, MODEL_MAX_TPS and MODEL_MAX_CONCURRENCY (unset: unlimited rate, 16)."""
+        def number(name: str) -> Optional[float]:
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        kwargs.setdefault("requests_per_second", number("MODEL_MAX_RPS"))
+        kwargs.setdefault("tokens_per_second", number("MODEL_MAX_TPS"))
+        kwargs.setdefault("max_concurrency", int(number("MODEL_MAX_CONCURRENCY") or 16))
+        return cls(**kwargs)
+
+    # Queue
+    def _dispatch(self) -> None:
+        # Called with the lock held whenever a slot, tokens or a new waiter may allow admission
+        now = time.monotonic()
+        while self._queue:
+            head = self._queue[0]
+            if head.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self.in_flight >= int(self.limit):
+                return
+            delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(head.tokens, now))
+            if delay > 0:
+                self._schedule(delay)
+                return
+            heapq.heappop(self._queue)
+            try:
+                head.loop.call_soon_threadsafe(_wake, head.future)
+            except RuntimeError:
+                continue  # Its event loop has closed; nobody is waiting any more
+            self._grant(head, now)
+
+    def _grant(self, waiter: _Waiter, now: float) -> None:
+        waiter.granted = True
+        self.in_flight += 1
+        self.requests.take(1, now)
+        self.tokens.take(waiter.tokens, now)
+        self.stats.admitted += 1
+        name = Priority(waiter.priority).name.lower()
+        self.stats.by_priority[name] = self.stats.by_priority.get(name, 0) + 1
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            return
+
+        def fire() -> None:
+            with self._lock:
+                self._timer = None
+                self._dispatch()
+
+        self._timer = threading.Timer(delay, fire)
+        self._timer.daemon = True
+        self._timer.start()
+
+    async def acquire(self, tokens: int, level: Optional[Priority] = None) -> None:
+        level = request_priority.get() if level is None else level
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = _Waiter(int(level), next(self._seq), tokens, loop, loop.create_future())
+            heapq.heappush(self._queue, waiter)
+            self._dispatch()
+            if waiter.granted:
+                return
+            self.stats.queued += 1
+        start = time.monotonic()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self.in_flight -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancelled = True
+            raise
+        with self._lock:
+            self.stats.wait_seconds += time.monotonic() - start
+
+    def release(self, latency: float, tokens: int, actual_tokens: Optional[int], error: Optional[bool]) -> None:
+        """Free the slot, settle the token estimate and adapt the concurrency limit.
+
+        `error` is None for a cancelled request, which says nothing about the server's health.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if actual_tokens:
+                self.tokens.take(actual_tokens - tokens, now)
+            if error is None:
+                self._dispatch()
+                return
+            per_token = latency / max(actual_tokens or tokens, 1)
+            overloaded = error or (
+                self._baseline is not None and per_token > self._baseline * self.latency_tolerance
+            )
+            if overloaded:
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._last_decrease = now
+                    self.limit = max(float(self.min_concurrency), self.limit / 2)
+                    self.stats.decreases += 1
+            elif self.limit < self.max_concurrency:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                self.stats.increases += 1
+            if error:
+                self.stats.errors += 1
+            elif self._baseline is None or per_token < self._baseline:
+                self._baseline = per_token
+            else:
+                # Drift up slowly, so one unusually fast response doesn't set the bar forever
+                self._baseline += 0.01 * (per_token - self._baseline)
+            self.stats.limit = round(self.limit, 2)
+            self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, tokens: int, level: Optional[Priority] = None) -> AsyncIterator["_Admission"]:
+        """Hold an admission slot for the duration of one request."""
+        await self.acquire(tokens, level)
+        admission = _Admission()
+        start = time.monotonic()
+        error: Optional[bool] = False
+        try:
+            yield admission
+        except asyncio.CancelledError:
+            error = None
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.release(time.monotonic() - start, tokens, admission.actual_tokens, error)
+
+
+@dataclass
+class _Admission:
+    actual_tokens: Optional[int] = None  # Set from the response's usage when known
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_shared: Optional[AdmissionController] = None
+_shared_lock = threading.Lock()
+
+
+def shared_controller() -> AdmissionController:
+    """The process-wide controller, configured from the environment on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AdmissionController.from_env()
+        return _shared
+
+
+class AdmittedModel(Model):
+    """Wrap a model so each request is admitted by `controller` (default: the shared one)."""
+
+    def __init__(self, model: Model, controller: Optional[AdmissionController] = None):
+        self.model = model
+        self.controller = controller or shared_controller()
+
+    async def agent_model(
+        self,
+        *,
+        function_tools: List[ToolDefinition],
+        allow_text_result: bool,
+        result_tools: List[ToolDefinition],
+    ) -> AgentModel:
+        inner = await self.model.agent_model(
+            function_tools=function_tools, allow_text_result=allow_text_result, result_tools=result_tools
+        )
+        return AdmittedAgentModel(inner, self.controller)
+
+    def name(self) -> str:
+        return self.model.name()
+
+
+class AdmittedAgentModel(AgentModel):
+    def __init__(self, inner: AgentModel, controller: AdmissionController):
+        self.inner = inner
+        self.controller = controller
+
+    async def request(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> Tuple[ModelResponse, Usage]:
+        async with self.controller.admit(estimate_request_tokens(messages, model_settings)) as admission:
+            response, usage = await self.inner.request(messages, model_settings)
+            admission.actual_tokens = usage.total_tokens
+            return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> AsyncIterator[EitherStreamedResponse]:
+        async with self.controller.admit(estimate_request_tokens(messages, model_settings)):
+            async with self.inner.request_stream(messages, model_settings) as response:
+                yield response
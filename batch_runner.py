@@ -0,0 +1,114 @@
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Generic, Iterable, List, Optional, TypeVar
+import asyncio
+import time
+
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+# Outcome of a single item in a batch
+@dataclass
+class BatchResult(Generic[T, R]):
+    """Result (or failure) of running the worker on one item."""
+    index: int  # Position of the item in the input
+    item: T
+    result: Optional[R] = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0  # Seconds spent on this item, including retries of the worker itself
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# Everything collected from a finished batch
+@dataclass
+class BatchSummary(Generic[T, R]):
+    """Successful results in input order plus the items that failed."""
+    results: List[BatchResult[T, R]] = field(default_factory=list)
+    failures: List[BatchResult[T, R]] = field(default_factory=list)
+
+    @property
+    def values(self) -> List[R]:
+        return [r.result for r in self.results]
+
+
+async def stream_batch(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    *,
+    max_concurrency: int = 8,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[BatchResult[T, R]]:
+    """Run `worker` over `items` with at most `max_concurrency` calls in flight.
+
+    Results are yielded as soon as they complete (not in input order). A failing or
+    timed-out item is yielded with `error` set instead of cancelling the rest of the batch.
+    Only `max_concurrency` tasks exist at any time, so `items` can be a large lazy iterable.
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    source = iter(enumerate(items))
+    done: asyncio.Queue = asyncio.Queue()
+
+    async def run_one(index: int, item: T) -> BatchResult[T, R]:
+        start = time.perf_counter()
+        try:
+            if timeout is None:
+                result = await worker(item)
+            else:
+                result = await asyncio.wait_for(worker(item), timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # Collected, not raised: one bad item must not sink the batch
+            return BatchResult(index, item, error=e, elapsed=time.perf_counter() - start)
+        return BatchResult(index, item, result=result, elapsed=time.perf_counter() - start)
+
+    async def lane() -> None:
+        # Each lane pulls the next item as soon as its previous one finishes
+        for index, item in source:
+            await done.put(await run_one(index, item))
+
+    lanes = [asyncio.create_task(lane()) for _ in range(max_concurrency)]
+    remaining = len(lanes)
+    for task in lanes:
+        task.add_done_callback(lambda _: done.put_nowait(None))
+
+    try:
+        while remaining:
+            entry = await done.get()
+            if entry is None:
+                remaining -= 1
+                continue
+            yield entry
+        # Surface unexpected lane errors (e.g. the items iterable itself raising)
+        for task in lanes:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        # Consumer stopped early or was cancelled: don't leave work running in the background
+        for task in lanes:
+            task.cancel()
+        await asyncio.gather(*lanes, return_exceptions=True)
+
+
+async def run_batch(
+    items: Iterable[T],
+    worker: Callable[[T], Awaitable[R]],
+    *,
+    max_concurrency: int = 8,
+    timeout: Optional[float] = None,
+    on_result: Optional[Callable[[BatchResult[T, R]], Any]] = None,
+) -> BatchSummary[T, R]:
+    """Run a whole batch and collect successes (in input order) and failures."""
+    summary: BatchSummary[T, R] = BatchSummary()
+    async for entry in stream_batch(items, worker, max_concurrency=max_concurrency, timeout=timeout):
+        if on_result is not None:
+            on_result(entry)
+        (summary.results if entry.ok else summary.failures).append(entry)
+    summary.results.sort(key=lambda r: r.index)
+    summary.failures.sort(key=lambda r: r.index)
+    return summary
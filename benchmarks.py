@@ -0,0 +1,267 @@
+"""Benchmark the agent workflows against the in-process LocalModel.
+
+Every agent is pointed at `local_model.LocalModel`, so the numbers measure our own orchestration
+(prompt rendering, tool calls, validation, batching) rather than Ollama. ocr_agent is left out
+because its tool needs Tesseract, poppler and a real PDF.
+
+    python benchmarks.py --iterations 200 --concurrency 16 --latency-ms 5
+    python benchmarks.py --json bench.json                        # save results
+    python benchmarks.py --baseline bench.json --tolerance 0.2    # exit 1 on a >20% regression
+"""
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from batch_runner import run_batch
+from local_model import LatencyDistribution, LocalModel
+
+
+@dataclass
+class Workflow:
+    """One script's workflow: the agents it uses and a coroutine running it once."""
+    name: str
+    agents: List[Any]
+    run: Callable[[int], Awaitable[Any]]
+    canned: Dict[Any, Any] = field(default_factory=dict)
+    call_tools: bool = False
+
+
+@dataclass
+class BenchmarkResult:
+    workflow: str
+    iterations: int
+    concurrency: int
+    seconds: float
+    throughput: float  # Workflow runs per second
+    p50_ms: float
+    p99_ms: float
+    peak_memory_mb: float
+    errors: int
+
+
+# Workflow definitions; modules are imported lazily so one broken script doesn't block the rest
+def parallel_workflow() -> Workflow:
+    import parallel_workflow as pw
+
+    async def run(i: int):
+        summary = await pw.process_datasets_in_parallel([f"Dataset {i}-{j}" for j in range(5)])
+        if summary.failures:
+            raise summary.failures[0].error
+        return summary
+
+    return Workflow("parallel_workflow", [pw.agent], run)
+
+
+def ad_recursive() -> Workflow:
+    import ad_recursive as ar
+
+    async def run(i: int):
+        benefits = await ar.benefit_agent.run(
+            "Generate consumer benefits.",
+            deps=ar.ProductDescription(product_or_service_description=f"product {i}"),
+        )
+        product_info = ar.AdCreativeInput(
+            product_or_service_description=f"product {i}", consumer_benefits=benefits.data.consumer_benefits
+        )
+        return await ar.run_tournament(product_info, threshold=9, candidates=3)
+
+    canned = {ar.EvaluatorOutput: ar.EvaluatorOutput(evaluation="Strong headline.", score=9)}
+    return Workflow("ad_recursive", [ar.benefit_agent, ar.creative_agent, ar.evaluator_agent], run, canned)
+
+
+def evaluator_optimizer() -> Workflow:
+    import evaluator_optimizer as eo
+
+    deps = eo.OfferDependencies(
+        dream_outcome="Achieve financial freedom through passive income.",
+        perceived_challenges=["Lack of time", "Fear of failure", "Limited resources"],
+        time_frame="3 months",
+        effort_and_sacrifice="Minimal learning curve, easy-to-follow steps.",
+        proof_of_success="100+ success stories, 30-day money-back guarantee.",
+        core_idea="Online course on automated investing strategies.",
+    )
+
+    async def run(i: int):
+        return await eo.offer_agent.run("Develop an irresistible offer based on these inputs.", deps=deps)
+
+    return Workflow("evaluator_optimizer", [eo.offer_agent], run, call_tools=True)
+
+
+def eval_opt_blogger() -> Workflow:
+    import eval_opt_blogger as eb
+
+    deps = eb.BlogEvalDependencies(target_audience="AI practitioners", target_readability=60)
+
+    async def run(i: int):
+        return await eb.blog_agent.run(
+            "Artificial Intelligence is a revolutionary field changing industries worldwide.", deps=deps
+        )
+
+    return Workflow("eval_opt_blogger", [eb.blog_agent], run, call_tools=True)
+
+
+def db_lookup_agent() -> Workflow:
+    import db_lookup_agent as db
+
+    database = db.SQLiteOrderDatabase()
+    database.seed(db.OrderDatabase.data)
+    orders = db.OrderCache(database)
+
+    async def run(i: int):
+        return await db.order_lookup_agent.run(
+            "Retrieve orders for the client", deps=db.Deps(client_id=i % 2 + 1, db=orders)
+        )
+
+    canned = {db.OrderResult: db.OrderResult(client_id=1, orders=db.OrderDatabase.data[1])}
+    return Workflow("db_lookup_agent", [db.order_lookup_agent], run, canned, call_tools=True)
+
+
+def cot_agent() -> Workflow:
+    import cot_agent as cot
+
+    deps = cot.CoTDependencies(
+        facts=cot.FactStore(["Fact 1: relevant data", "Fact 2: irrelevant data", "Fact 3: relevant insight"]),
+        user_question="What can we deduce from relevant data?",
+    )
+
+    async def run(i: int):
+        return await cot.agent.run("Explain why the sky appears blue during the day but red at sunset.", deps=deps)
+
+    return Workflow("cot_agent", [cot.agent], run, call_tools=True)
+
+
+def adheadline_agent() -> Workflow:
+    import adheadline_agent as ah
+
+    async def run(i: int):
+        summary = await ah.headline_graph.run_many(
+            [{"product_description": f"product {i}-{j}"} for j in range(5)], max_concurrency=ah.MAX_IN_FLIGHT
+        )
+        if summary.failures:
+            raise summary.failures[0].error
+        return summary
+
+    agents = [ah.describe_agent, ah.benefits_agent, ah.hypotheses_agent, ah.refine_agent]
+    return Workflow("adheadline_agent", agents, run)
+
+
+WORKFLOWS: Dict[str, Callable[[], Workflow]] = {
+    "parallel_workflow": parallel_workflow,
+    "ad_recursive": ad_recursive,
+    "evaluator_optimizer": evaluator_optimizer,
+    "eval_opt_blogger": eval_opt_blogger,
+    "db_lookup_agent": db_lookup_agent,
+    "cot_agent": cot_agent,
+    "adheadline_agent": adheadline_agent,
+}
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_benchmark(
+    workflow: Workflow,
+    iterations: int = 100,
+    concurrency: int = 8,
+    latency: Optional[LatencyDistribution] = None,
+) -> BenchmarkResult:
+    model = LocalModel(latency=latency, canned=workflow.canned, call_tools=workflow.call_tools)
+    with ExitStack() as stack:
+        for agent in workflow.agents:
+            stack.enter_context(agent.override(model=model))
+
+        await workflow.run(-1)  # Warm-up: schema building, imports, connection setup
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        summary = await run_batch(range(iterations), workflow.run, max_concurrency=concurrency)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies = sorted(r.elapsed * 1000 for r in summary.results)
+    return BenchmarkResult(
+        workflow=workflow.name,
+        iterations=iterations,
+        concurrency=concurrency,
+        seconds=round(seconds, 4),
+        throughput=round(len(summary.results) / seconds, 2) if seconds else 0.0,
+        p50_ms=round(_percentile(latencies, 0.50), 3),
+        p99_ms=round(_percentile(latencies, 0.99), 3),
+        peak_memory_mb=round(peak / 1e6, 3),
+        errors=len(summary.failures),
+    )
+
+
+def find_regressions(
+    results: List[BenchmarkResult], baseline: Dict[str, Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """Compare against a saved run: lower throughput or higher p99/peak memory beyond `tolerance`."""
+    problems = []
+    for result in results:
+        before = baseline.get(result.workflow)
+        if before is None:
+            continue
+        if result.errors:
+            problems.append(f"{result.workflow}: {result.errors} failed runs")
+        if result.throughput < before["throughput"] * (1 - tolerance):
+            problems.append(f"{result.workflow}: throughput {result.throughput} < {before['throughput']}")
+        if result.p99_ms > before["p99_ms"] * (1 + tolerance):
+            problems.append(f"{result.workflow}: p99 {result.p99_ms}ms > {before['p99_ms']}ms")
+        if result.peak_memory_mb > before["peak_memory_mb"] * (1 + tolerance):
+            problems.append(f"{result.workflow}: peak memory {result.peak_memory_mb}MB > {before['peak_memory_mb']}MB")
+    return problems
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="median simulated model latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="lognormal spread; 0 for fixed latency")
+    parser.add_argument("--only", nargs="*", choices=sorted(WORKFLOWS), help="workflows to run")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.latency_sigma:
+        latency = LatencyDistribution.lognormal(args.latency_ms / 1000, args.latency_sigma)
+    else:
+        latency = LatencyDistribution.fixed(args.latency_ms / 1000)
+
+    results = []
+    print(f"{'workflow':<22}{'runs/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'errors':>8}")
+    for name in args.only or WORKFLOWS:
+        result = await run_benchmark(WORKFLOWS[name](), args.iterations, args.concurrency, latency)
+        results.append(result)
+        print(
+            f"{result.workflow:<22}{result.throughput:>10}{result.p50_ms:>10}"
+            f"{result.p99_ms:>10}{result.peak_memory_mb:>10}{result.errors:>8}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({r.workflow: asdict(r) for r in results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = find_regressions(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 1 if any(r.errors for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,134 @@
+"""Durable checkpoints so a crashed or redeployed batch resumes instead of starting over.
+
+`CheckpointJournal` is an append-only JSON Lines file with one record per completed step, keyed by
+item and stage (e.g. `("Dataset A", "quality_report")`). Wrapping a step in `journal.step(...)`
+returns the recorded result if that step already finished in an earlier run, and otherwise runs
+it and records the result before returning:
+
+    journal = CheckpointJournal(".checkpoints/datasets.jsonl")
+    report = await journal.step(dataset, "quality_report", QualityReport, lambda: analyze(dataset))
+
+Each record is flushed (and fsynced by default) as soon as its step completes, so a crash loses at
+most the steps that were still in flight. A torn last line from a crash mid-write is ignored on
+load. Call `journal.complete()` once the whole batch has succeeded, so the next batch starts from
+scratch instead of replaying it, and `journal.close()` when giving up on an incomplete one.
+"""
+from dataclasses import dataclass
+from typing import IO, Any, Awaitable, Callable, Dict, Optional, Type, TypeVar
+import json
+import os
+import threading
+
+from pydantic import TypeAdapter
+from pydantic_core import to_jsonable_python
+
+from prompt_templates import fingerprint
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class CheckpointStats:
+    resumed: int = 0  # Steps answered from the journal
+    recorded: int = 0  # Steps run and appended to the journal
+
+
+class CheckpointJournal:
+    """Append-only journal of completed (item, stage) results."""
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.fsync = fsync
+        self.stats = CheckpointStats()
+        self._records: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._file: Optional[IO[str]] = None  # Opened by the first `record`
+
+    @classmethod
+    def from_env(cls, name: str, **kwargs: Any) -> Optional["CheckpointJournal"]:
+        """`<CHECKPOINT_DIR>/<name>.jsonl`, or None (no checkpointing) when CHECKPOINT_DIR is unset."""
+        directory = os.getenv("CHECKPOINT_DIR")
+        return cls(os.path.join(directory, f"{name}.jsonl"), **kwargs) if directory else None
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            content = f.read()
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn write from a crash
+            self._records[record["key"]] = record["value"]
+        if content and not content.endswith("\n"):
+            # Terminate the torn line so the next record starts on its own line
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    @staticmethod
+    def _key(item: Any, stage: str) -> str:
+        return fingerprint([item, stage])
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def done(self, item: Any, stage: str) -> bool:
+        return self._key(item, stage) in self._records
+
+    def get(self, item: Any, stage: str, result_type: Type[T]) -> Optional[T]:
+        """The recorded result of `stage` for `item`, validated as `result_type`, or None."""
+        raw = self._records.get(self._key(item, stage))
+        return None if raw is None else TypeAdapter(result_type).validate_python(raw)
+
+    def record(self, item: Any, stage: str, value: Any) -> None:
+        key = self._key(item, stage)
+        raw = to_jsonable_python(value)
+        line = json.dumps({"key": key, "item": to_jsonable_python(item), "stage": stage, "value": raw})
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._records[key] = raw
+            self.stats.recorded += 1
+
+    async def step(self, item: Any, stage: str, result_type: Type[T], fn: Callable[[], Awaitable[T]]) -> T:
+        """Return the recorded result of this step, or run `fn`, record its result and return it."""
+        done = self.get(item, stage, result_type)
+        if done is not None:
+            self.stats.resumed += 1
+            return done
+        value = await fn()
+        self.record(item, stage, value)
+        return value
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def complete(self) -> None:
+        """The batch finished: close and delete the journal, so a later run starts over."""
+        self.close()
+        with self._lock:
+            self._records.clear()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+async def checkpointed(
+    journal: Optional[CheckpointJournal], item: Any, stage: str, result_type: Type[T], fn: Callable[[], Awaitable[T]]
+) -> T:
+    """`journal.step(...)`, or just `fn()` when there is no journal."""
+    if journal is None:
+        return await fn()
+    return await journal.step(item, stage, result_type, fn)
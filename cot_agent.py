@@ -2,16 +2,18 @@ from pydantic_ai.models.ollama import OllamaModel
 from dataclasses import dataclass
 from pydantic_ai import Agent, RunContext
 from typing import List
-import nest_asyncio
 
+from admission import AdmittedModel
+from fact_store import FactStore
+from instrumentation import instrument_from_env
+import runtime
+from prompt_templates import PromptTemplate
 
-nest_asyncio.apply()
 
-
-model = OllamaModel(
+model = AdmittedModel(OllamaModel(
     model_name='qwen2.5:7b',  
     base_url='http://localhost:11434/v1/',  
-)
+))
 
 
 agent = Agent(
@@ -19,17 +21,19 @@ agent = Agent(
     system_prompt='You are an expert in reasoning. Break down complex problems step-by-step before arriving at a conclusion.',
 )
 
+# How many facts are retrieved for a question and put in the prompt
+TOP_K_FACTS = 5
+
 @dataclass
 class CoTDependencies:
-    facts: List[str]  # Facts to use for reasoning
+    facts: FactStore  # Indexed facts to use for reasoning; build once and share across runs
     user_question: str  # Question posed by the user
 
 
 @agent.tool
 async def retrieve_relevant_facts(ctx: RunContext[CoTDependencies]) -> List[str]:
     """Extracts facts relevant to the user's question."""
-    # Filter facts based on the question (dummy example)
-    return [fact for fact in ctx.deps.facts if 'relevant' in fact]
+    return ctx.deps.facts.search(ctx.deps.user_question, k=TOP_K_FACTS)
 
 @agent.tool
 async def analyze_facts(ctx: RunContext[CoTDependencies], facts: List[str]) -> str:
@@ -42,12 +46,22 @@ async def final_conclusion(ctx: RunContext[CoTDependencies], analysis: str) -> s
     return f"Using the analysis: {analysis}, the final answer is clear."
 
 
+# Instructions first and the per-question deps last, so the prompt prefix stays stable
+CONTEXT_PROMPT = PromptTemplate(
+    "Think step-by-step using these facts: {facts}. The user has asked: {user_question}."
+)
+
 @agent.system_prompt
 async def include_context(ctx: RunContext[CoTDependencies]) -> str:
-    return f"The user has asked: {ctx.deps.user_question}. Think step-by-step using these facts: {ctx.deps.facts}."
+    # Only the best-matching facts, so the prompt stays small however large the store grows
+    facts = ctx.deps.facts.search(ctx.deps.user_question, k=TOP_K_FACTS)
+    return CONTEXT_PROMPT.render(facts=facts, user_question=ctx.deps.user_question)
+
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(cot_agent=agent)
 
 # deps = CoTDependencies(
-#         facts=["Fact 1: relevant data", "Fact 2: irrelevant data", "Fact 3: relevant insight"],
+#         facts=FactStore(["Fact 1: relevant data", "Fact 2: irrelevant data", "Fact 3: relevant insight"]),
 #         user_question="What can we deduce from relevant data?"
 #     )
 
@@ -58,7 +72,7 @@ async def include_context(ctx: RunContext[CoTDependencies]) -> str:
 async def main():
     # Define dependencies
     deps = CoTDependencies(
-        facts=["Fact 1: relevant data", "Fact 2: irrelevant data", "Fact 3: relevant insight"],
+        facts=FactStore(["Fact 1: relevant data", "Fact 2: irrelevant data", "Fact 3: relevant insight"]),
         user_question="What can we deduce from relevant data?"
     )
 
@@ -66,7 +80,7 @@ async def main():
     result = await agent.run("Explain why the sky appears blue during the day but red at sunset.", deps=deps)
     print(result.data)
 
-# Use an event loop to execute the main function
-import asyncio
-asyncio.run(main())
+# Run on the shared background event loop
+if __name__ == "__main__":
+    runtime.run(main())
 
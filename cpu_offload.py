@@ -0,0 +1,90 @@
+"""Run CPU-bound work in a shared, warm process pool instead of on the event loop.
+
+A synchronous, CPU-heavy function called from a tool stalls every other coroutine on the loop
+(e.g. all the concurrent runs in `process_datasets_in_parallel`). `run_cpu_bound` runs it in a
+worker process and awaits the result instead:
+
+    pages = await run_cpu_bound(_scan_pages, pdf_path, use_text_layer, min_text_chars, dpi, True)
+
+Each call pays for pickling and a round trip to another process, so reserve this for work
+measured in tens of milliseconds or more (rendering and OCR), not quick vectorised metrics.
+
+The function must be defined at module level, so workers can import it by name, and its
+arguments and result must be picklable.
+
+All calls share one `ProcessPoolExecutor`, sized by AGENT_CPU_WORKERS (default: CPU count). It is
+created on first use and kept for the life of the process, so workers stay warm: each one pays
+the interpreter start and the module imports once, not per call.
+Workers are started with "spawn", which is safe alongside the background event loop thread.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+import asyncio
+import atexit
+import importlib
+import multiprocessing
+import os
+import threading
+import weakref
+
+
+T = TypeVar("T")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# Queued-but-unstarted calls allowed per worker before callers wait (per event loop)
+MAX_PENDING_PER_WORKER = 4
+_pending: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def pool_size() -> int:
+    return int(os.getenv("AGENT_CPU_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def shared_pool() -> ProcessPoolExecutor:
+    """The process-wide worker pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=pool_size(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+atexit.register(shutdown)
+
+
+def _invoke(module: str, qualname: str, args: tuple, kwargs: dict) -> Any:
+    # Runs in the worker: look the function up by name and call it
+    target: Any = importlib.import_module(module)
+    for name in qualname.split("."):
+        target = getattr(target, name)
+    return target(*args, **kwargs)
+
+
+def _limit() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limit = _pending.get(loop)
+    if limit is None:
+        # A semaphore that ever queued a waiter holds its loop, so weak keys alone don't free it
+        for closed in [l for l in _pending if l.is_closed()]:
+            del _pending[closed]
+        limit = _pending[loop] = asyncio.Semaphore(pool_size() * (1 + MAX_PENDING_PER_WORKER))
+    return limit
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a module-level function in the shared pool and await its result."""
+    async with _limit():
+        future: Future = shared_pool().submit(_invoke, fn.__module__, fn.__qualname__, args, kwargs)
+        return await asyncio.wrap_future(future)
+
@@ -4,18 +4,28 @@ from pydantic_ai import Agent, RunContext, ModelRetry
 
 from pydantic_ai.models.ollama import OllamaModel
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Literal
+from typing import Callable, List, Dict, Any, Iterable, Literal, Optional, Set, Union
 from datetime import date
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from contextvars import ContextVar
+import asyncio
+import functools
+import itertools
+import sqlite3
 
-import nest_asyncio
-nest_asyncio.apply()
+from response_cache import TTLCache
+from output_repair import RepairingModel
+from admission import AdmittedModel
+from singleflight import coalesce_runs
+from instrumentation import instrument_from_env
+import runtime
 
 
-model = OllamaModel(
+# Near-miss results are repaired locally rather than spending one of the retries
+model = RepairingModel(AdmittedModel(OllamaModel(
     model_name='qwen2.5:7b',  
     base_url='http://localhost:11434/v1/',  
-)
+)))
 
 
 # Simulated database
@@ -31,12 +41,262 @@ class OrderDatabase:
             raise ModelRetry(f"No orders found for client_id: {client_id}")
         return cls.data[client_id]
 
+    @classmethod
+    async def get_orders_many(cls, client_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+        return {client_id: cls.data[client_id] for client_id in client_ids if client_id in cls.data}
+
+
+# SQLite-backed database
+class ConnectionPool:
+    """A fixed set of SQLite connections handed out to worker threads.
+
+    Shared-cache in-memory databases use table-level locks, so a read that overlaps a write on
+    another connection fails with "database table is locked" instead of waiting; such calls are
+    retried with backoff, up to `lock_retries` times.
+    """
+
+    def __init__(self, database: str, size: int = 4, lock_retries: int = 8, lock_backoff: float = 0.001):
+        self.database = database
+        self.size = size
+        self.lock_retries = lock_retries
+        self.lock_backoff = lock_backoff
+        self._idle: "asyncio.Queue[sqlite3.Connection]" = asyncio.Queue()
+        self._created = 0
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    async def run(self, fn, *args):
+        """Run `fn(conn, *args)` in a thread with a pooled connection."""
+        if self._idle.empty() and self._created < self.size:
+            self._created += 1
+            conn = self.connect()
+        else:
+            conn = await self._idle.get()
+        try:
+            for attempt in range(self.lock_retries + 1):
+                try:
+                    return await asyncio.to_thread(fn, conn, *args)
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) or attempt == self.lock_retries:
+                        raise
+                await asyncio.sleep(self.lock_backoff * 2 ** attempt)
+        finally:
+            self._idle.put_nowait(conn)
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+class SQLiteOrderDatabase:
+    """Orders stored in SQLite, with the same `get_orders` interface as `OrderDatabase`.
+
+    Concurrent `get_orders` calls that arrive within `batch_window` seconds of each other
+    are coalesced into a single `get_orders_many` query.
+    """
+
+    _memory_ids = itertools.count()
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        pool_size: int = 4,
+        batch_window: float = 0.002,
+        max_batch_size: int = 500,
+    ):
+        if path == ":memory:":
+            # A named shared-cache database, so every pooled connection sees the same data
+            path = f"file:orders_{next(self._memory_ids)}?mode=memory&cache=shared"
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.pool = ConnectionPool(path, size=pool_size)
+        # Kept open for the lifetime of the object (keeps in-memory databases alive)
+        self._conn = self.pool.connect()
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "order_id INTEGER PRIMARY KEY, client_id INTEGER NOT NULL, item TEXT NOT NULL, quantity INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS orders_client_id ON orders (client_id)")
+        self._pending: Dict[int, List[asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._resolving: Set[asyncio.Task] = set()  # Strong references until each batch resolves
+        self._listeners: List[Callable[[int], Any]] = []
+
+    def on_change(self, listener: Callable[[int], Any]) -> None:
+        """Register `listener(client_id)` to be called whenever a client's orders change."""
+        self._listeners.append(listener)
+
+    def _notify(self, client_ids: Iterable[int]) -> None:
+        for client_id in set(client_ids):
+            for listener in self._listeners:
+                listener(client_id)
+
+    def seed(self, data: Dict[int, List[Dict[str, Any]]]) -> None:
+        """Load orders in the `OrderDatabase.data` shape."""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO orders (order_id, client_id, item, quantity) VALUES (?, ?, ?, ?)",
+                [
+                    (order["order_id"], client_id, order["item"], order["quantity"])
+                    for client_id, orders in data.items()
+                    for order in orders
+                ],
+            )
+        self._notify(data)
+
+    async def add_order(self, client_id: int, order: Dict[str, Any]) -> None:
+        def insert(conn: sqlite3.Connection) -> None:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO orders (order_id, client_id, item, quantity) VALUES (?, ?, ?, ?)",
+                    (order["order_id"], client_id, order["item"], order["quantity"]),
+                )
+
+        await self.pool.run(insert)
+        self._notify([client_id])
+
+    async def get_orders_many(self, client_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Fetch orders for many clients; clients without orders are left out of the result."""
+        client_ids = list(dict.fromkeys(client_ids))
+        found: Dict[int, List[Dict[str, Any]]] = {}
+
+        def select(conn: sqlite3.Connection, ids: List[int]) -> List[sqlite3.Row]:
+            placeholders = ",".join("?" * len(ids))
+            return conn.execute(
+                "SELECT client_id, order_id, item, quantity FROM orders "
+                f"WHERE client_id IN ({placeholders}) ORDER BY order_id",
+                ids,
+            ).fetchall()
+
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(client_ids), self.max_batch_size):
+            rows = await self.pool.run(select, client_ids[start:start + self.max_batch_size])
+            for row in rows:
+                found.setdefault(row["client_id"], []).append(
+                    {"order_id": row["order_id"], "item": row["item"], "quantity": row["quantity"]}
+                )
+        return found
+
+    async def get_orders(self, client_id: int) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(client_id, []).append(future)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            task = asyncio.ensure_future(self._resolve(pending))
+            self._resolving.add(task)
+            task.add_done_callback(self._resolving.discard)
+
+    async def _resolve(self, pending: Dict[int, List[asyncio.Future]]) -> None:
+        try:
+            found = await self.get_orders_many(pending)
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for client_id, futures in pending.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if client_id in found:
+                    future.set_result(found[client_id])
+                else:
+                    future.set_exception(ModelRetry(f"No orders found for client_id: {client_id}"))
+
+    def close(self) -> None:
+        self.pool.close()
+        self._conn.close()
+
+
+# Read-through cache in front of either database
+class OrderCache:
+    """Shared TTL/LRU cache with the same `get_orders` interface as the databases.
+
+    Unknown clients are cached too, for the shorter `negative_ttl`, so repeated lookups of a
+    bad ID don't reach the database. Entries are dropped automatically when the wrapped
+    database reports a change (see `SQLiteOrderDatabase.on_change`), or explicitly with
+    `invalidate`.
+    """
+
+    def __init__(
+        self,
+        db: Union[OrderDatabase, SQLiteOrderDatabase],
+        ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+        max_entries: int = 10_000,
+    ):
+        self.db = db
+        self.negative_ttl = negative_ttl
+        self.entries = TTLCache(max_entries=max_entries, ttl=ttl)
+        if hasattr(db, "on_change"):
+            db.on_change(self.invalidate)
+
+    async def get_orders(self, client_id: int) -> List[Dict[str, Any]]:
+        cached = self.entries.get(client_id)
+        if isinstance(cached, ModelRetry):
+            raise cached
+        if cached is not None:
+            return cached
+        try:
+            orders = await self.db.get_orders(client_id)
+        except ModelRetry as e:
+            self.entries.set(client_id, e, ttl=self.negative_ttl)
+            raise
+        self.entries.set(client_id, orders)
+        return orders
+
+    async def get_orders_many(self, client_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+        client_ids = list(client_ids)
+        found = {}
+        missing = []
+        for client_id in client_ids:
+            cached = self.entries.get(client_id)
+            if isinstance(cached, ModelRetry):
+                continue
+            if cached is None:
+                missing.append(client_id)
+            else:
+                found[client_id] = cached
+        if missing:
+            fetched = await self.db.get_orders_many(missing)
+            for client_id in missing:
+                if client_id in fetched:
+                    self.entries.set(client_id, fetched[client_id])
+                    found[client_id] = fetched[client_id]
+                else:
+                    self.entries.set(
+                        client_id, ModelRetry(f"No orders found for client_id: {client_id}"), ttl=self.negative_ttl
+                    )
+        return found
+
+    def invalidate(self, client_id: int) -> None:
+        self.entries.invalidate(client_id)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
 
 # Dependencies for the agent
 @dataclass
 class Deps:
     client_id: int
-    db: OrderDatabase
+    db: Union[OrderDatabase, SQLiteOrderDatabase, OrderCache]
 
 
 # Define the result model
@@ -57,24 +317,77 @@ order_lookup_agent = Agent(
 )
 
 
+# Lookups already made during the current run; set afresh by `memoize_per_run` for every run,
+# so reused deps never carry results (or misses) past the cache's TTL and invalidation
+_run_memo: ContextVar[Optional[Dict[int, Any]]] = ContextVar("order_lookup_memo", default=None)
+
+
+def memoize_per_run(agent: Agent) -> None:
+    """Wrap `agent.run` (and so `run_sync`) to give each run its own lookup memo."""
+    run = agent.run
+
+    @functools.wraps(run)
+    async def run_with_memo(user_prompt: str, **kwargs: Any):
+        token = _run_memo.set({})
+        try:
+            return await run(user_prompt, **kwargs)
+        finally:
+            _run_memo.reset(token)
+
+    agent.run = run_with_memo
+
+
 # Define the tool for order lookup
 @order_lookup_agent.tool
 async def get_client_orders(ctx: RunContext[Deps]) -> List[Dict[str, Any]]:
     """Fetch orders for a client based on their ID."""
     if not isinstance(ctx.deps.client_id, int):
         return "### Error: Client ID must be an integer."
-    return await ctx.deps.db.get_orders(ctx.deps.client_id)
+    client_id = ctx.deps.client_id
+    # The model often calls this tool repeatedly within one run (and across retries)
+    memo = _run_memo.get()
+    if memo is None:
+        memo = {}  # Not started through the wrapped `run` (e.g. `run_stream`)
+    if client_id not in memo:
+        try:
+            memo[client_id] = await ctx.deps.db.get_orders(client_id)
+        except ModelRetry as e:
+            memo[client_id] = e
+    orders = memo[client_id]
+    if isinstance(orders, ModelRetry):
+        raise orders
+    return orders
+
+
+memoize_per_run(order_lookup_agent)
+
+# Concurrent lookups for the same client share one run; deps hold a database handle,
+# so the key uses the client id and database identity rather than serializing them
+order_runs = coalesce_runs(
+    order_lookup_agent, key=lambda prompt, deps: (prompt, deps.client_id, id(deps.db))
+)
+
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(order_lookup_agent=order_lookup_agent)
 
 
 # Example usage
-if __name__ == "__main__":
+async def main():
     # Simulate a client request
-    deps = Deps(client_id=1, db=OrderDatabase())
+    db = SQLiteOrderDatabase()
+    db.seed(OrderDatabase.data)
+    orders_cache = OrderCache(db)  # Share one cache across runs
+    deps = Deps(client_id=1, db=orders_cache)
     try:
-        result = order_lookup_agent.run_sync("Retrieve orders for the client", deps=deps)
+        result = await order_lookup_agent.run("Retrieve orders for the client", deps=deps)
         print(result.data)
     except ValidationError as e:
         print("Validation error:", e)
     except ModelRetry as e:
         print("Retryable error:", e)
+    print("Coalesced runs:", order_runs.stats)
+
+
+if __name__ == "__main__":
+    runtime.run(main())
 
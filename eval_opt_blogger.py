@@ -3,18 +3,28 @@ from typing import List
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.ollama import OllamaModel
-import asyncio
-import nest_asyncio
+import os
 
+from response_cache import CachedModel
+from output_repair import RepairingModel, format_stats
+from admission import AdmittedModel
+from text_metrics import compute_text_metrics
+from originality_index import OriginalityIndex
+from instrumentation import instrument_from_env
+import runtime
 
-nest_asyncio.apply()
 
-
-# Instantiate the model
-model = OllamaModel(
+# Instantiate the model; near-miss results (e.g. a score just outside its bounds) are repaired
+# locally instead of retried, and repeated identical requests are served from the response cache
+repairing_model = RepairingModel(AdmittedModel(OllamaModel(
     model_name='qwen2.5:7b',
     base_url='http://localhost:11434/v1/',
-)
+)))
+model = CachedModel(repairing_model)
+
+# Published posts that drafts are compared against; build the index with
+# `python originality_index.py <dir> posts/*.md` and point BLOG_CORPUS_INDEX at <dir>
+corpus_index = OriginalityIndex(os.getenv("BLOG_CORPUS_INDEX") or None)
 
 # Dependencies for the evaluator
 class BlogEvalDependencies(BaseModel):
@@ -43,36 +53,32 @@ blog_agent = Agent(
 @blog_agent.tool
 async def evaluate_coherence(ctx: RunContext[BlogEvalDependencies], text: str) -> float:
     """Evaluate the coherence of the provided text."""
-    # Mocked coherence calculation logic
-    coherence = len(set(text.split())) / len(text.split())
-    return round(coherence, 2)
+    # Mocked coherence calculation logic (unique words / total words)
+    return float(compute_text_metrics([text]).coherence[0])
 
 # Tool to evaluate readability
 @blog_agent.tool
 async def evaluate_readability(ctx: RunContext[BlogEvalDependencies], text: str) -> float:
     """Evaluate the readability of the provided text (Flesch-Kincaid)."""
-    words = text.split()
-    sentences = text.count('.') + text.count('!') + text.count('?')
-    syllables = sum(sum(1 for char in word if char in "aeiouAEIOU") for word in words)
-    readability = 206.835 - 1.015 * (len(words) / max(1, sentences)) - 84.6 * (syllables / len(words))
-    return round(max(0, min(100, readability)), 2)
+    return float(compute_text_metrics([text]).readability[0])
 
 # Tool to evaluate originality
 @blog_agent.tool
 async def evaluate_originality(ctx: RunContext[BlogEvalDependencies], text: str) -> float:
-    """Evaluate the originality of the provided text."""
-    # Mock originality logic (real implementation may involve similarity checks)
-    originality = 1.0  # Assume fully original for mock
-    return originality
+    """Evaluate the originality of the provided text against published posts (1.0 = nothing similar)."""
+    return corpus_index.originality(text)
 
 # Generate improvement suggestions
 @blog_agent.system_prompt
-async def generate_improvement_suggestions(ctx: RunContext[BlogEvalDependencies], text: str) -> str:
+async def generate_improvement_suggestions(ctx: RunContext[BlogEvalDependencies]) -> str:
     return (
         f"Please suggest improvements for a blog targeting '{ctx.deps.target_audience}' "
         f"to achieve a readability score of at least {ctx.deps.target_readability}."
     )
 
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(blog_agent=blog_agent)
+
 # Main evaluation logic
 async def main():
     deps = BlogEvalDependencies(target_audience="AI practitioners", target_readability=60)
@@ -86,6 +92,10 @@ async def main():
     print(f"Originality Score: {result.data.originality_score}")
     print(f"Readability Score: {result.data.readability_score}")
     print(f"Improvement Suggestions: {result.data.improvement_suggestions}")
+    print(f"Response cache: {model.cache.stats}")
+    print(format_stats(repairing_model.stats))
+    print(f"Posts in originality index: {len(corpus_index)}")
 
 # Trigger the main evaluation process
-asyncio.run(main())
+if __name__ == "__main__":
+    runtime.run(main())
@@ -3,18 +3,19 @@ from typing import List
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.ollama import OllamaModel
-import asyncio
-import nest_asyncio
 
+from response_cache import CachedModel
+from admission import AdmittedModel
+from tool_prefetch import deterministic, prefetch_deterministic_tools
+from instrumentation import instrument_from_env
+import runtime
 
-nest_asyncio.apply()
 
-
-# Instantiate the model
-model = OllamaModel(
+# Instantiate the model; repeated identical requests are served from the response cache
+model = CachedModel(AdmittedModel(OllamaModel(
     model_name='qwen2.5:7b',
     base_url='http://localhost:11434/v1/',
-)
+)))
 
 # Define Dependencies
 class OfferDependencies(BaseModel):
@@ -74,6 +75,7 @@ async def calculate_value_equation(
 
 # Tool for Optimizing Bonuses
 @offer_agent.tool
+@deterministic
 async def generate_bonuses(ctx: RunContext[OfferDependencies]) -> list[str]:
     """
     Generate complementary bonuses that enhance the core offer and address perceived challenges.
@@ -87,6 +89,7 @@ async def generate_bonuses(ctx: RunContext[OfferDependencies]) -> list[str]:
 
 # Tool for Crafting Scarcity
 @offer_agent.tool
+@deterministic
 async def create_scarcity(ctx: RunContext[OfferDependencies]) -> str:
     """
     Design a scarcity strategy to create urgency, such as limited-time offers or exclusive spots.
@@ -96,6 +99,7 @@ async def create_scarcity(ctx: RunContext[OfferDependencies]) -> str:
 
 # Tool for Messaging
 @offer_agent.tool
+@deterministic
 async def craft_messaging(ctx: RunContext[OfferDependencies]) -> str:
     """
     Create compelling messaging that highlights the benefits and transformation customers will experience.
@@ -107,6 +111,15 @@ async def craft_messaging(ctx: RunContext[OfferDependencies]) -> str:
     )
 
 
+# The deterministic tools above only read the deps: run them before the first model call and
+# put their results in the system prompt, instead of a model round trip per tool.
+# calculate_value_equation stays a normal tool because the model picks its weights.
+prefetcher = prefetch_deterministic_tools(offer_agent)
+
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(offer_agent=offer_agent)
+
+
 # Example usage
 async def main():
     # Define dependencies for the agent
@@ -124,12 +137,14 @@ async def main():
         "Develop an irresistible offer based on these inputs.", deps=deps
     )
     print(result.data)
+    print(f"Response cache: {model.cache.stats}")
+    print(f"Prefetched tools: {prefetcher.stats}")
 
 
 if __name__ == "__main__":
     import asyncio
 
-    asyncio.run(main())
+    runtime.run(main())
 
 
     # core_offer='A 6-month online course on digital marketing for small businesses' 
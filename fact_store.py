@@ -0,0 +1,96 @@
+"""Retrieve the facts that matter for a question, instead of scanning or inlining all of them.
+
+`FactStore` keeps an inverted index from terms to the facts containing them and ranks facts
+with BM25. Build it once for a knowledge base and share it across runs, e.g. through deps:
+
+    store = FactStore(load_facts())
+    deps = CoTDependencies(facts=store, user_question="Why is the sky blue?")
+    store.search(deps.user_question, k=5)   # the 5 best-matching facts
+
+A search only visits the postings of the question's terms (common words are skipped), so its
+cost depends on how many facts share terms with the question, not on the size of the store.
+Results are memoized per (question, k) until the next `add`.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+import heapq
+import math
+import re
+
+from response_cache import CacheStats, TTLCache
+
+
+_TERM = re.compile(r"\w+")
+# Words that appear in most questions and facts; indexing them would make every search O(N)
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how in is it of on or that the this to was we what"
+    " when where which who why will with".split()
+)
+
+
+def terms(text: str) -> List[str]:
+    return [t for t in _TERM.findall(text.lower()) if t not in STOPWORDS]
+
+
+class FactStore:
+    """BM25-ranked inverted index over a growing list of facts."""
+
+    def __init__(self, facts: Iterable[str] = (), k1: float = 1.5, b: float = 0.75, max_entries: int = 256):
+        self.k1 = k1
+        self.b = b
+        self.facts: List[str] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)  # term -> [(fact, term count)]
+        self._memo = TTLCache(max_entries=max_entries)
+        self.stats = CacheStats()
+        self.add_many(facts)
+
+    def __len__(self) -> int:
+        return len(self.facts)
+
+    def add(self, fact: str) -> None:
+        self.add_many([fact])
+
+    def add_many(self, facts: Iterable[str]) -> None:
+        for fact in facts:
+            fact_id = len(self.facts)
+            counts: Dict[str, int] = defaultdict(int)
+            fact_terms = terms(fact)
+            for term in fact_terms:
+                counts[term] += 1
+            for term, count in counts.items():
+                self._postings[term].append((fact_id, count))
+            self.facts.append(fact)
+            self._lengths.append(len(fact_terms))
+            self._total_length += len(fact_terms)
+        self._memo.clear()
+
+    def search_scored(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """The top `k` facts for `query` with their BM25 scores, best first."""
+        key = (query, k)
+        cached = self._memo.get(key)
+        if cached is not None:
+            self.stats.hits += 1
+            return cached
+        self.stats.misses += 1
+
+        n = len(self.facts)
+        average_length = self._total_length / n if n else 0.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(terms(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for fact_id, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[fact_id] / average_length)
+                scores[fact_id] += idf * count * (self.k1 + 1) / (count + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        result = [(self.facts[fact_id], round(score, 4)) for fact_id, score in best]
+        self._memo.set(key, result)
+        return result
+
+    def search(self, query: str, k: int = 5) -> List[str]:
+        """The top `k` facts for `query`, best first."""
+        return [fact for fact, _ in self.search_scored(query, k)]
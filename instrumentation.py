@@ -0,0 +1,335 @@
+"""Per-run timing and token spans for agents, written to a local JSON-lines file.
+
+`instrument_agent` wraps an agent's `run` (and therefore `run_sync`), its model, every
+registered tool, every system prompt function, its result validators and result-schema
+validation. Each wrapper records a span, with parents tracked through a context variable, so
+one agent run becomes a small trace:
+
+    agent.run
+      system_prompt:<function>
+      model.request        (tokens, cache_hit)
+      tool:<name>          (retry count, outcome)
+      validate:<result tool>
+
+Spans are appended as one JSON object per line, either in a flat format or as OTLP/JSON
+`resourceSpans` that OpenTelemetry tooling can import. Scripts opt in via `instrument_from_env`,
+which does nothing unless AGENT_TRACE_FILE is set. To see which stage dominates wall time:
+
+    AGENT_TRACE_FILE=trace.jsonl python evaluator_optimizer.py
+    python instrumentation.py trace.jsonl
+
+The wrappers patch pydantic-ai internals (`_function_tools`, `_system_prompt_functions`,
+`_result_validators`, `_result_schema`) on the instances they are given, as of pydantic-ai 0.0.18.
+Streaming runs (`run_stream`) are not wrapped.
+"""
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import functools
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelMessage, ModelResponse, RetryPromptPart
+from pydantic_ai.models import AgentModel, EitherStreamedResponse, Model
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.usage import Usage
+
+from response_cache import served_from_cache
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: Optional[str]
+    start_time_unix_nano: int
+    end_time_unix_nano: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_time_unix_nano - self.start_time_unix_nano) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+
+# Exporter: one line per finished span
+class JsonLinesExporter:
+    """Append finished spans to `path`; `otlp=True` writes OTLP/JSON `resourceSpans` lines."""
+
+    def __init__(self, path: str, otlp: bool = False, service_name: str = "pydantic-ai-agents"):
+        self.path = path
+        self.otlp = otlp
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        record = self._otlp(span) if self.otlp else {
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_span_id": span.parent_span_id,
+            "start_time_unix_nano": span.start_time_unix_nano,
+            "end_time_unix_nano": span.end_time_unix_nano,
+            "duration_ms": round(span.duration_ms, 3),
+            "status": span.status,
+            "attributes": span.attributes,
+        }
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    def _otlp(self, span: Span) -> Dict[str, Any]:
+        def value(v: Any) -> Dict[str, Any]:
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "instrumentation"},
+                    "spans": [{
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_span_id or "",
+                        "name": span.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(span.start_time_unix_nano),
+                        "endTimeUnixNano": str(span.end_time_unix_nano),
+                        "attributes": [{"key": k, "value": value(v)} for k, v in span.attributes.items()],
+                        "status": {"code": 1 if span.status == "ok" else 2},
+                    }],
+                }],
+            }]
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    def __init__(self, exporter: JsonLinesExporter):
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_span_id=parent.span_id if parent else None,
+            start_time_unix_nano=time.time_ns(),
+        )
+        span.set(**attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set(error=repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_unix_nano = time.time_ns()
+            self.exporter.export(span)
+
+
+# Model wrapper: one span per model request
+class InstrumentedModel(Model):
+    def __init__(self, model: Model, tracer: Tracer):
+        self.model = model
+        self.tracer = tracer
+
+    async def agent_model(
+        self,
+        *,
+        function_tools: List[ToolDefinition],
+        allow_text_result: bool,
+        result_tools: List[ToolDefinition],
+    ) -> AgentModel:
+        inner = await self.model.agent_model(
+            function_tools=function_tools, allow_text_result=allow_text_result, result_tools=result_tools
+        )
+        return InstrumentedAgentModel(inner, self.tracer, self.model.name())
+
+    def name(self) -> str:
+        return self.model.name()
+
+
+class InstrumentedAgentModel(AgentModel):
+    def __init__(self, inner: AgentModel, tracer: Tracer, model_name: str):
+        self.inner = inner
+        self.tracer = tracer
+        self.model_name = model_name
+
+    async def request(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> Tuple[ModelResponse, Usage]:
+        with self.tracer.span("model.request", model=self.model_name, messages=len(messages)) as span:
+            served_from_cache.set(False)
+            response, usage = await self.inner.request(messages, model_settings)
+            span.set(
+                request_tokens=usage.request_tokens,
+                response_tokens=usage.response_tokens,
+                total_tokens=usage.total_tokens,
+                cache_hit=served_from_cache.get(),
+            )
+            return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> AsyncIterator[EitherStreamedResponse]:
+        async with self.inner.request_stream(messages, model_settings) as response:
+            yield response
+
+
+def _wrap_run(agent: Agent, tracer: Tracer, label: str) -> None:
+    run = agent.run
+
+    @functools.wraps(run)
+    async def instrumented_run(user_prompt: str, **kwargs: Any):
+        with tracer.span("agent.run", agent=label, prompt_chars=len(user_prompt)) as span:
+            result = await run(user_prompt, **kwargs)
+            usage = result.usage()
+            span.set(
+                requests=usage.requests,
+                request_tokens=usage.request_tokens,
+                response_tokens=usage.response_tokens,
+                total_tokens=usage.total_tokens,
+                retries=sum(
+                    isinstance(part, RetryPromptPart)
+                    for message in result.new_messages()
+                    for part in getattr(message, "parts", [])
+                ),
+            )
+            return result
+
+    agent.run = instrumented_run
+
+
+def _wrap_tool(tool: Any, tracer: Tracer, label: str) -> None:
+    run = tool.run
+
+    async def instrumented_tool_run(message, run_context):
+        with tracer.span(f"tool:{tool.name}", agent=label, retry=tool.current_retry) as span:
+            part = await run(message, run_context)
+            span.set(outcome="retry" if isinstance(part, RetryPromptPart) else "ok")
+            return part
+
+    tool.run = instrumented_tool_run
+
+
+def _wrap_system_prompt(runner: Any, tracer: Tracer, label: str) -> None:
+    run = runner.run
+    name = getattr(runner.function, "__name__", "system_prompt")
+
+    async def instrumented_prompt_run(run_context):
+        with tracer.span(f"system_prompt:{name}", agent=label) as span:
+            prompt = await run(run_context)
+            span.set(chars=len(prompt))
+            return prompt
+
+    runner.run = instrumented_prompt_run
+
+
+def _wrap_result_validation(agent: Agent, tracer: Tracer, label: str) -> None:
+    schema = agent._result_schema
+    for result_tool in schema.tools.values() if schema is not None else []:
+        validate = result_tool.validate
+
+        def instrumented_validate(tool_call, *args, _validate=validate, **kwargs):
+            with tracer.span(f"validate:{tool_call.tool_name}", agent=label) as span:
+                try:
+                    return _validate(tool_call, *args, **kwargs)
+                except Exception:
+                    span.set(outcome="retry")
+                    raise
+
+        result_tool.validate = instrumented_validate
+
+    for validator in agent._result_validators:
+        validate = validator.validate
+
+        async def instrumented_validator(result, tool_call, run_context, _validate=validate, _validator=validator):
+            name = getattr(_validator.function, "__name__", "result_validator")
+            with tracer.span(f"result_validator:{name}", agent=label):
+                return await _validate(result, tool_call, run_context)
+
+        validator.validate = instrumented_validator
+
+
+def instrument_agent(agent: Agent, tracer: Tracer, label: Optional[str] = None) -> Agent:
+    """Wrap `agent` in place; call after all tools and system prompts are registered."""
+    if getattr(agent, "_instrumented", False):
+        return agent
+    label = label or agent.name or "agent"
+    _wrap_run(agent, tracer, label)
+    if agent.model is not None and not isinstance(agent.model, str):
+        agent.model = InstrumentedModel(agent.model, tracer)
+    for tool in agent._function_tools.values():
+        _wrap_tool(tool, tracer, label)
+    for runner in agent._system_prompt_functions:
+        _wrap_system_prompt(runner, tracer, label)
+    _wrap_result_validation(agent, tracer, label)
+    agent._instrumented = True
+    return agent
+
+
+def instrument_from_env(**agents: Agent) -> Optional[Tracer]:
+    """Instrument the given agents (keyword = label) when AGENT_TRACE_FILE is set.
+
+    AGENT_TRACE_FORMAT=otlp switches the file to OTLP/JSON lines.
+    """
+    path = os.getenv("AGENT_TRACE_FILE")
+    if not path:
+        return None
+    tracer = Tracer(JsonLinesExporter(path, otlp=os.getenv("AGENT_TRACE_FORMAT") == "otlp"))
+    for label, agent in agents.items():
+        instrument_agent(agent, tracer, label)
+    return tracer
+
+
+def summarize(path: str) -> List[Tuple[str, int, float, float, int]]:
+    """Aggregate a flat trace file: (span name, count, total ms, mean ms, total tokens), slowest first."""
+    totals: Dict[str, List[float]] = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if "resourceSpans" in record:
+                span = record["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+                name = span["name"]
+                ms = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                attrs = {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+            else:
+                name, ms, attrs = record["name"], record["duration_ms"], record["attributes"]
+            entry = totals.setdefault(name, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += ms
+            if name == "model.request":
+                entry[2] += int(attrs.get("total_tokens") or 0)
+    rows = [(name, n, round(ms, 3), round(ms / n, 3), tokens) for name, (n, ms, tokens) in totals.items()]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+if __name__ == "__main__":
+    print(f"{'span':<40}{'count':>8}{'total ms':>12}{'mean ms':>10}{'tokens':>10}")
+    for row in summarize(sys.argv[1]):
+        print(f"{row[0]:<40}{row[1]:>8}{row[2]:>12}{row[3]:>10}{row[4]:>10}")
@@ -0,0 +1,304 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Union
+import asyncio
+import random
+import typing
+
+from pydantic import BaseModel
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    ModelResponsePart,
+    RetryPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+)
+from pydantic_ai.models import (
+    AgentModel,
+    EitherStreamedResponse,
+    Model,
+    StreamStructuredResponse,
+    StreamTextResponse,
+)
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.usage import Usage
+
+from output_repair import schema_name
+
+
+# How long each fake model call takes
+@dataclass
+class LatencyDistribution:
+    """Latency in seconds: 'fixed' (a), 'uniform' (a..b) or 'lognormal' (median a, sigma b)."""
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return self.a * rng.lognormvariate(0.0, self.b)
+        raise ValueError(f"Unknown latency distribution: {self.kind}")
+
+    @classmethod
+    def fixed(cls, seconds: float) -> "LatencyDistribution":
+        return cls("fixed", seconds)
+
+    @classmethod
+    def uniform(cls, low: float, high: float) -> "LatencyDistribution":
+        return cls("uniform", low, high)
+
+    @classmethod
+    def lognormal(cls, median: float, sigma: float = 0.5) -> "LatencyDistribution":
+        return cls("lognormal", median, sigma)
+
+
+def result_type_name(result_type: Any) -> str:
+    """Name used to look up canned outputs, e.g. 'QualityReport' or 'List[OCRResult]'."""
+    if isinstance(result_type, str):
+        return result_type
+    origin = typing.get_origin(result_type)
+    if origin in (list, List):
+        (item,) = typing.get_args(result_type)
+        return f"List[{result_type_name(item)}]"
+    return getattr(result_type, "__name__", str(result_type))
+
+
+# Deterministic data for any JSON schema, respecting bounds so results validate
+def sample_from_schema(schema: Dict[str, Any], defs: Optional[Dict[str, Any]] = None) -> Any:
+    defs = schema.get("$defs", defs or {})
+    if "$ref" in schema:
+        return sample_from_schema(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return sample_from_schema(options[0], defs)
+    if "default" in schema:
+        return schema["default"]
+
+    kind = schema.get("type", "object")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {name: sample_from_schema(prop, defs) for name, prop in properties.items()}
+    if kind == "array":
+        count = max(schema.get("minItems", 0), 1)
+        return [sample_from_schema(schema.get("items", {}), defs) for _ in range(count)]
+    if kind in ("integer", "number"):
+        value = 1
+        if "minimum" in schema:
+            value = max(value, schema["minimum"])
+        if "exclusiveMinimum" in schema:
+            value = max(value, schema["exclusiveMinimum"] + 1)
+        if "maximum" in schema:
+            value = min(value, schema["maximum"])
+        return int(value) if kind == "integer" else float(value)
+    if kind == "boolean":
+        return False
+    if kind == "string":
+        if schema.get("format") == "date":
+            return "2025-01-01"
+        return schema.get("title", "text").lower()
+    return None
+
+
+CannedOutput = Union[Any, Callable[[List[ModelMessage]], Any]]
+
+
+class LocalModel(Model):
+    """Stand-in for `OllamaModel` that never leaves the process.
+
+    Each request sleeps for a sample from `latency`, optionally calls every function tool
+    once (`call_tools=True`), then returns the canned output registered for the agent's
+    result_type, or schema-valid placeholder data if none is registered. Canned outputs are
+    keyed by result type or name ('QualityReport', 'List[OCRResult]') and may be model
+    instances, plain JSON data, or callables taking the message history.
+    Streamed requests (`run_stream`) send the same response `chunk_chars` characters at a time.
+    Token usage is estimated at four characters per token.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyDistribution] = None,
+        canned: Optional[Dict[Any, CannedOutput]] = None,
+        call_tools: bool = False,
+        text: str = "Local model response.",
+        seed: int = 0,
+        chunk_chars: int = 16,
+    ):
+        self.latency = latency or LatencyDistribution()
+        self.canned = {result_type_name(k): v for k, v in (canned or {}).items()}
+        self.call_tools = call_tools
+        self.text = text
+        self.rng = random.Random(seed)
+        self.chunk_chars = chunk_chars
+
+    async def agent_model(
+        self,
+        *,
+        function_tools: List[ToolDefinition],
+        allow_text_result: bool,
+        result_tools: List[ToolDefinition],
+    ) -> AgentModel:
+        return LocalAgentModel(self, function_tools, allow_text_result, result_tools)
+
+    def name(self) -> str:
+        return "local"
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _estimate_tokens(payload: Any) -> int:
+    return max(1, len(str(payload)) // 4)
+
+
+@dataclass
+class LocalAgentModel(AgentModel):
+    model: LocalModel
+    function_tools: List[ToolDefinition]
+    allow_text_result: bool
+    result_tools: List[ToolDefinition]
+
+    def _respond(self, messages: List[ModelMessage]) -> ModelResponse:
+        last = messages[-1]
+        tools_answered = isinstance(last, ModelRequest) and any(
+            isinstance(p, (ToolReturnPart, RetryPromptPart)) for p in last.parts
+        )
+        if self.model.call_tools and self.function_tools and not tools_answered:
+            parts: List[ModelResponsePart] = [
+                ToolCallPart.from_raw_args(tool.name, sample_from_schema(tool.parameters_json_schema))
+                for tool in self.function_tools
+            ]
+            return ModelResponse(parts=parts)
+
+        if self.result_tools:
+            tool = self.result_tools[0]
+            name = schema_name(tool)
+            if name in self.model.canned:
+                output = self.model.canned[name]
+                output = _jsonable(output(messages) if callable(output) else output)
+            else:
+                inner = tool.parameters_json_schema
+                if tool.outer_typed_dict_key is not None:
+                    inner = dict(inner["properties"][tool.outer_typed_dict_key], **{"$defs": inner.get("$defs", {})})
+                output = sample_from_schema(inner)
+            args = {tool.outer_typed_dict_key: output} if tool.outer_typed_dict_key else output
+            return ModelResponse(parts=[ToolCallPart.from_raw_args(tool.name, args)])
+        return ModelResponse.from_text(self.model.text)
+
+    async def request(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> Tuple[ModelResponse, Usage]:
+        delay = self.model.latency.sample(self.model.rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        response = self._respond(messages)
+        request_tokens = _estimate_tokens(messages)
+        response_tokens = _estimate_tokens(response.parts)
+        usage = Usage(
+            request_tokens=request_tokens,
+            response_tokens=response_tokens,
+            total_tokens=request_tokens + response_tokens,
+        )
+        return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> AsyncIterator[EitherStreamedResponse]:
+        response, usage = await self.request(messages, model_settings)
+        if all(isinstance(part, TextPart) for part in response.parts):
+            yield LocalStreamTextResponse(response, usage, self.model.chunk_chars)
+        else:
+            yield LocalStreamStructuredResponse(response, usage, self.model.chunk_chars)
+
+
+# Streaming: the complete response, released a chunk per iteration
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+@dataclass
+class LocalStreamTextResponse(StreamTextResponse):
+    response: ModelResponse
+    _usage: Usage
+    chunk_chars: int
+    _pending: List[str] = field(default_factory=list)
+    _buffer: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        text = "".join(part.content for part in self.response.parts if isinstance(part, TextPart))
+        self._pending = _chunks(text, self.chunk_chars)[::-1]
+
+    async def __anext__(self) -> None:
+        if not self._pending:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        self._buffer.append(self._pending.pop())
+
+    def get(self, *, final: bool = False) -> Iterable[str]:
+        delta, self._buffer = self._buffer, []
+        return delta
+
+    def usage(self) -> Usage:
+        return self._usage
+
+    def timestamp(self) -> datetime:
+        return self.response.timestamp
+
+
+@dataclass
+class LocalStreamStructuredResponse(StreamStructuredResponse):
+    """Tool calls streamed one after another, each as a growing JSON arguments string."""
+
+    response: ModelResponse
+    _usage: Usage
+    chunk_chars: int
+    _pending: List[Tuple[int, str]] = field(default_factory=list)
+    _received: Dict[int, str] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self._pending = [
+            (index, chunk)
+            for index, part in enumerate(self.response.parts)
+            if isinstance(part, ToolCallPart)
+            for chunk in _chunks(part.args_as_json_str(), self.chunk_chars)
+        ][::-1]
+
+    async def __anext__(self) -> None:
+        if not self._pending:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        index, chunk = self._pending.pop()
+        self._received[index] = self._received.get(index, "") + chunk
+
+    def get(self, *, final: bool = False) -> ModelResponse:
+        parts: List[ModelResponsePart] = []
+        for index, args in self._received.items():
+            part = self.response.parts[index]
+            assert isinstance(part, ToolCallPart)
+            parts.append(ToolCallPart.from_raw_args(part.tool_name, args, part.tool_call_id))
+        return ModelResponse(parts=parts, timestamp=self.response.timestamp)
+
+    def usage(self) -> Usage:
+        return self._usage
+
+    def timestamp(self) -> datetime:
+        return self.response.timestamp
@@ -0,0 +1,257 @@
+"""Spread agent traffic across several Ollama replicas.
+
+`ModelPool` is a pydantic-ai `Model`, so it can be passed wherever a script passes `model=`:
+
+    model = ModelPool("qwen2.5:7b", ["http://gpu-1:11434/v1/", "http://gpu-2:11434/v1/"])
+    model = ModelPool.from_env("qwen2.5:7b")   # OLLAMA_BASE_URLS=url1,url2 (default: localhost)
+
+Each request goes to the healthy replica with the fewest outstanding requests. Each replica
+allows at most `max_concurrency` requests at once, and further requests queue on it. A request
+that fails with a connection error, a timeout or a 5xx status is retried once on another
+replica. A replica that fails `eject_after` times in a row is ejected for `eject_seconds`. After
+that it gets one trial request, or is readmitted early by `check_health()`. Each replica keeps
+its own keep-alive HTTP connection pool. The OpenAI client's own retries are turned off, so
+failover is immediate.
+"""
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+import asyncio
+import itertools
+import os
+import time
+
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.models import AgentModel, EitherStreamedResponse, Model
+from pydantic_ai.models.ollama import OllamaModel
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.usage import Usage
+
+
+DEFAULT_BASE_URL = "http://localhost:11434/v1/"
+
+
+class NoHealthyReplica(RuntimeError):
+    pass
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Failures another replica might not have: connection problems, timeouts and 5xx responses."""
+    if isinstance(error, (APIConnectionError, httpx.TransportError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+@dataclass
+class Replica:
+    base_url: str
+    model_name: str
+    max_concurrency: int
+    timeout: float
+    outstanding: int = 0  # In flight plus queued on this replica
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    _limits: Dict[Any, asyncio.Semaphore] = field(default_factory=dict, repr=False)
+    _http_client: Optional[httpx.AsyncClient] = field(default=None, repr=False)
+    _model: Optional[OllamaModel] = field(default=None, repr=False)
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        # Created on first use, not when a script imports its pool
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+            )
+        return self._http_client
+
+    @property
+    def model(self) -> OllamaModel:
+        if self._model is None:
+            client = AsyncOpenAI(base_url=self.base_url, api_key="ollama", http_client=self.http_client, max_retries=0)
+            self._model = OllamaModel(self.model_name, base_url=None, openai_client=client)
+        return self._model
+
+    @property
+    def ejected(self) -> bool:
+        return self.ejected_until > time.monotonic()
+
+    def limit(self) -> asyncio.Semaphore:
+        # One semaphore per event loop (asyncio primitives bind to the loop they are used in)
+        loop = asyncio.get_running_loop()
+        if loop not in self._limits:
+            self._limits[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._limits[loop]
+
+
+class ModelPool(Model):
+    """Least-outstanding-requests load balancer over Ollama replicas serving the same model."""
+
+    def __init__(
+        self,
+        model_name: str,
+        base_urls: Sequence[str] = (DEFAULT_BASE_URL,),
+        max_concurrency: int = 4,
+        max_attempts: int = 2,
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        timeout: float = 120.0,
+    ):
+        if not base_urls:
+            raise ValueError("ModelPool needs at least one base URL")
+        self.model_name = model_name
+        self.max_attempts = max_attempts
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.replicas = [
+            Replica(base_url=base_url, model_name=model_name, max_concurrency=max_concurrency, timeout=timeout)
+            for base_url in base_urls
+        ]
+        self._tie_break = itertools.count()
+
+    @classmethod
+    def from_env(cls, model_name: str, **kwargs: Any) -> "ModelPool":
+        """Replicas from OLLAMA_BASE_URLS (comma separated), defaulting to the local server."""
+        urls = [u.strip() for u in os.getenv("OLLAMA_BASE_URLS", DEFAULT_BASE_URL).split(",") if u.strip()]
+        return cls(model_name, urls, **kwargs)
+
+    def name(self) -> str:
+        return f"ollama:{self.model_name}"
+
+    async def agent_model(
+        self,
+        *,
+        function_tools: List[ToolDefinition],
+        allow_text_result: bool,
+        result_tools: List[ToolDefinition],
+    ) -> AgentModel:
+        inner = [
+            await replica.model.agent_model(
+                function_tools=function_tools, allow_text_result=allow_text_result, result_tools=result_tools
+            )
+            for replica in self.replicas
+        ]
+        return PooledAgentModel(self, inner)
+
+    # Replica selection and health bookkeeping
+    def pick(self, exclude: Set[int] = frozenset()) -> int:
+        candidates = [i for i, r in enumerate(self.replicas) if i not in exclude and not r.ejected]
+        if not candidates:
+            # Everything is ejected: trying a possibly recovered replica beats failing outright
+            candidates = [i for i in range(len(self.replicas)) if i not in exclude]
+        if not candidates:
+            raise NoHealthyReplica(f"No healthy replica for {self.model_name} (tried {len(exclude)})")
+        # Rotate the starting point so ties don't always land on the first replica
+        offset = next(self._tie_break)
+        candidates = candidates[offset % len(candidates):] + candidates[:offset % len(candidates)]
+        return min(candidates, key=lambda i: self.replicas[i].outstanding)
+
+    def record_success(self, replica: Replica) -> None:
+        replica.consecutive_failures = 0
+        replica.ejected_until = 0.0
+
+    def record_failure(self, replica: Replica) -> None:
+        replica.failures += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.eject_after:
+            replica.ejected_until = time.monotonic() + self.eject_seconds
+
+    async def check_health(self, timeout: float = 5.0) -> Dict[str, bool]:
+        """Probe every replica's /models endpoint; healthy ones are readmitted immediately."""
+        async def probe(replica: Replica) -> bool:
+            try:
+                response = await replica.http_client.get(f"{replica.base_url.rstrip('/')}/models", timeout=timeout)
+                healthy = response.status_code < 500
+            except httpx.HTTPError:
+                healthy = False
+            if healthy:
+                self.record_success(replica)
+            else:
+                replica.consecutive_failures = max(replica.consecutive_failures, self.eject_after)
+                replica.ejected_until = time.monotonic() + self.eject_seconds
+            return healthy
+
+        results = await asyncio.gather(*(probe(r) for r in self.replicas))
+        return {r.base_url: ok for r, ok in zip(self.replicas, results)}
+
+    async def run_health_checks(self, interval: float = 10.0) -> None:
+        """Probe replicas every `interval` seconds; run as a background task."""
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "base_url": r.base_url,
+                "outstanding": r.outstanding,
+                "requests": r.requests,
+                "failures": r.failures,
+                "ejected": r.ejected,
+            }
+            for r in self.replicas
+        ]
+
+    async def aclose(self) -> None:
+        clients = [r._http_client for r in self.replicas if r._http_client is not None]
+        await asyncio.gather(*(client.aclose() for client in clients))
+        for replica in self.replicas:
+            replica._http_client = replica._model = None
+
+
+class PooledAgentModel(AgentModel):
+    def __init__(self, pool: ModelPool, inner: List[AgentModel]):
+        self.pool = pool
+        self.inner = inner
+
+    async def request(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> Tuple[ModelResponse, Usage]:
+        tried: Set[int] = set()
+        while True:
+            index = self.pool.pick(tried)
+            replica = self.pool.replicas[index]
+            tried.add(index)
+            replica.outstanding += 1
+            try:
+                async with replica.limit():
+                    replica.requests += 1
+                    response, usage = await self.inner[index].request(messages, model_settings)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.pool.record_failure(replica)
+                if len(tried) >= self.pool.max_attempts or len(tried) == len(self.pool.replicas):
+                    raise
+                continue
+            finally:
+                replica.outstanding -= 1
+            self.pool.record_success(replica)
+            return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> AsyncIterator[EitherStreamedResponse]:
+        # Streams are not retried: once tokens have been yielded there is no clean way to switch
+        index = self.pool.pick()
+        replica = self.pool.replicas[index]
+        replica.outstanding += 1
+        try:
+            async with replica.limit():
+                replica.requests += 1
+                try:
+                    async with self.inner[index].request_stream(messages, model_settings) as response:
+                        yield response
+                except Exception as e:
+                    if is_retryable(e):
+                        self.pool.record_failure(replica)
+                    raise
+                self.pool.record_success(replica)
+        finally:
+            replica.outstanding -= 1
@@ -1,9 +1,13 @@
+from collections import deque
 from dataclasses import dataclass
-from typing import List
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 from PIL import Image
 from pytesseract import pytesseract
 from PyPDF2 import PdfReader
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+import asyncio
+import hashlib
+import os
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
 
@@ -14,21 +18,36 @@ from datetime import date
 
 from dataclasses import dataclass
 
-import nest_asyncio
-nest_asyncio.apply()
+from admission import AdmittedModel
+from cpu_offload import pool_size, run_cpu_bound
+from response_cache import ResponseCache
+from structured_stream import stream_list_items
+from instrumentation import instrument_from_env
+import runtime
 
-# Set the Tesseract OCR path (adjust as necessary for your system)
-pytesseract.tesseract_cmd = '/opt/homebrew/bin/tesseract'  
 
-model = OllamaModel(
+# Set the Tesseract OCR path (adjust as necessary for your system)
+TESSERACT_CMD = '/opt/homebrew/bin/tesseract'
+pytesseract.tesseract_cmd = TESSERACT_CMD
+
+# Pages rendered per worker task; peak memory is roughly chunk size x workers page images
+OCR_CHUNK_SIZE = 8
+OCR_DPI = 200
+# Pages whose embedded text layer has fewer characters than this are OCR'd instead
+MIN_TEXT_LAYER_CHARS = 20
+# OCR output keyed by page content hash; set OCR_CACHE_PATH to keep it across runs
+OCR_CACHE = ResponseCache(max_entries=4096, path=os.getenv("OCR_CACHE_PATH") or None)
+
+model = AdmittedModel(OllamaModel(
     model_name='qwen2.5:7b',  
     base_url='http://localhost:11434/v1/',  
-)
+))
 
 @dataclass
 class OCRDependencies:
     """Dependencies required for OCR processing."""
     pdf_path: str  # Path to the PDF to be processed
+    use_text_layer: bool = True  # Use the embedded text layer where present, OCR only the rest
 
 
 class OCRResult(BaseModel):
@@ -45,8 +64,136 @@ ocr_agent = Agent(
 )
 
 
+def _ocr_page_range(pdf_path: str, first_page: int, last_page: int, tesseract_cmd: str, dpi: int) -> List[str]:
+    """Render and OCR one chunk of pages inside a worker process."""
+    pytesseract.tesseract_cmd = tesseract_cmd
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    return [pytesseract.image_to_string(image) for image in images]
+
+
+def page_content_hash(page, dpi: int = OCR_DPI) -> str:
+    """Hash everything that affects how a page renders: content streams, images, geometry."""
+    digest = hashlib.sha256(f"{dpi}|{page.mediabox}|{page.get('/Rotate', 0)}".encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        for name, xobject in sorted(xobjects.get_object().items()):
+            digest.update(name.encode())
+            digest.update(xobject.get_object().get_data())
+    return digest.hexdigest()
+
+
+def _scan_pages(
+    pdf_path: str, use_text_layer: bool, min_text_chars: int, dpi: int, hash_pages: bool
+) -> List[Tuple[int, Optional[str], Optional[str]]]:
+    """Per page: its text layer when usable, else its content hash (when `hash_pages`). Runs in a worker."""
+    if not use_text_layer and not hash_pages:
+        page_count = pdfinfo_from_path(pdf_path)["Pages"]
+        return [(n, None, None) for n in range(1, page_count + 1)]
+
+    pages = []
+    reader = PdfReader(pdf_path)
+    for page_number, page in enumerate(reader.pages, start=1):
+        text = None
+        if use_text_layer:
+            text = page.extract_text() or ""
+            text = text if len(text.strip()) >= min_text_chars else None
+        key = page_content_hash(page, dpi) if text is None and hash_pages else None
+        pages.append((page_number, text, key))
+    return pages
+
+
+async def _plan_pages(
+    pdf_path: str, use_text_layer: bool, min_text_chars: int, cache: Optional[ResponseCache], dpi: int
+) -> Tuple[List[Tuple[int, Optional[str]]], Dict[int, str]]:
+    """Work out which pages already have text (text layer or cache) and which need OCR."""
+    scanned = await run_cpu_bound(_scan_pages, pdf_path, use_text_layer, min_text_chars, dpi, cache is not None)
+    plan = []
+    cache_keys = {}
+    for page_number, text, key in scanned:
+        if text is None and key is not None:
+            text = cache.get(key)
+            if text is None:
+                cache_keys[page_number] = key
+        plan.append((page_number, text))
+    return plan, cache_keys
+
+
+def _ocr_chunks(pages: List[int], chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Group the pages that need OCR into contiguous ranges of at most `chunk_size`."""
+    first = last = None
+    for page_number in pages:
+        if first is not None and page_number == last + 1 and page_number - first < chunk_size:
+            last = page_number
+            continue
+        if first is not None:
+            yield first, last
+        first = last = page_number
+    if first is not None:
+        yield first, last
+
+
+async def iter_ocr_results(
+    pdf_path: str,
+    chunk_size: int = OCR_CHUNK_SIZE,
+    max_in_flight: Optional[int] = None,
+    dpi: int = OCR_DPI,
+    use_text_layer: bool = True,
+    min_text_chars: int = MIN_TEXT_LAYER_CHARS,
+    cache: Optional[ResponseCache] = OCR_CACHE,
+) -> AsyncIterator[OCRResult]:
+    """
+    Stream OCR results for a PDF in page order.
+
+    Pages with a usable embedded text layer (at least `min_text_chars` characters) are
+    returned without rendering. Pages whose content hash is in `cache` reuse the earlier
+    OCR output (pass `cache=None` to disable). The rest are rendered and OCR'd in chunks on the
+    shared CPU worker pool, with at most `max_in_flight` chunks (default: two per worker) queued
+    at once. Only a bounded number of page images exist at any time, and the event loop stays
+    free for other runs while pages are parsed and OCR'd.
+    """
+    plan, cache_keys = await _plan_pages(pdf_path, use_text_layer, min_text_chars, cache, dpi)
+    max_in_flight = max_in_flight or pool_size() * 2
+    chunks = _ocr_chunks([n for n, text in plan if text is None], chunk_size)
+    in_flight = deque()
+    ocr_texts = {}
+
+    def submit_next() -> None:
+        chunk = next(chunks, None)
+        if chunk is not None:
+            first, last = chunk
+            task = asyncio.ensure_future(
+                run_cpu_bound(_ocr_page_range, pdf_path, first, last, pytesseract.tesseract_cmd, dpi)
+            )
+            in_flight.append((first, task))
+
+    for _ in range(max_in_flight):
+        submit_next()
+
+    try:
+        for page_number, text in plan:
+            if text is None:
+                if page_number not in ocr_texts:
+                    # Chunks are submitted in page order, so the oldest one holds this page
+                    first, task = in_flight.popleft()
+                    for offset, chunk_text in enumerate(await task):
+                        ocr_texts[first + offset] = chunk_text
+                        if first + offset in cache_keys:
+                            cache.set(cache_keys[first + offset], chunk_text)
+                    submit_next()
+                text = ocr_texts.pop(page_number)
+            yield OCRResult(page_number=page_number, extracted_text=text)
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True)
+
+
 @ocr_agent.tool
-def extract_text_from_pdf(ctx: RunContext[OCRDependencies]) -> List[OCRResult]:
+async def extract_text_from_pdf(ctx: RunContext[OCRDependencies]) -> List[OCRResult]:
     """
     Extract text from a PDF file using OCR.
     
@@ -56,24 +203,26 @@ def extract_text_from_pdf(ctx: RunContext[OCRDependencies]) -> List[OCRResult]:
     Returns:
         List[OCRResult]: List of extracted text per page.
     """
-    pdf_path = ctx.deps.pdf_path
-    results = []
+    return [page async for page in iter_ocr_results(ctx.deps.pdf_path, use_text_layer=ctx.deps.use_text_layer)]
+
 
-    # Convert PDF pages to images
-    images = convert_from_path(pdf_path)
-    for page_number, image in enumerate(images, start=1):
-        text = pytesseract.image_to_string(image)
-        results.append(OCRResult(page_number=page_number, extracted_text=text))
+async def stream_ocr_pages(deps: OCRDependencies) -> AsyncIterator[OCRResult]:
+    """Yield each page as soon as the agent has written it out, instead of after the whole list."""
+    async for page in stream_list_items(ocr_agent, "Extract text from the provided PDF.", OCRResult, deps=deps):
+        yield page
 
-    return results
 
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(ocr_agent=ocr_agent)
 
 
 # Example usage
 if __name__ == "__main__":
-    deps = OCRDependencies(pdf_path="test.pdf")
-    results = ocr_agent.run_sync("Extract text from the provided PDF.", deps=deps)
-    for result in results:
-        print(f"Page {result.page_number}:")
-        print(result.extracted_text)
-        print("-" * 50)
+    async def main():
+        deps = OCRDependencies(pdf_path="test.pdf")
+        async for result in stream_ocr_pages(deps):
+            print(f"Page {result.page_number}:")
+            print(result.extracted_text)
+            print("-" * 50)
+
+    runtime.run(main())
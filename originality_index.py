@@ -0,0 +1,290 @@
+"""Score how original a draft is against a local corpus of published posts.
+
+Each post is reduced to a MinHash signature over its word shingles (runs of `shingle_size`
+words). The fraction of matching signature slots between two posts estimates the Jaccard
+similarity of their shingle sets. Signatures are stored in a memory-mapped array, so the corpus
+does not have to fit in RAM and reopening an index is instant. Candidates are found with LSH:
+the signature is split into `bands`, and only posts that share an entire band with the draft are
+compared. Each band's keys are kept sorted in a memory-mapped table, so a lookup costs a binary
+search per band over the map, not a scan of the corpus:
+
+    index = OriginalityIndex("corpus.idx")
+    index.add("post-123", published_text)
+    index.originality(draft)   # 1.0 = nothing similar, 0.0 = a published post repeated verbatim
+
+With the defaults (128 hashes, 32 bands of 4), a post sharing half its shingles with the draft is
+found about 87% of the time, and one sharing 80% is almost always found.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import re
+import zlib
+import numpy as np
+
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Match:
+    doc_id: str
+    similarity: float  # Estimated Jaccard similarity of the shingle sets
+
+
+def _odd_u64(rng: np.random.Generator, n: int) -> np.ndarray:
+    return rng.integers(0, 2**63, size=n, dtype=np.uint64) << np.uint64(1) | np.uint64(1)
+
+
+class OriginalityIndex:
+    """MinHash/LSH index over a corpus, stored in `path` (a directory) or in memory when `path` is None."""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        num_perm: int = 128,
+        bands: int = 32,
+        shingle_size: int = 3,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        meta = self._load_meta()
+        if meta is not None:
+            num_perm, bands, shingle_size, seed = meta["num_perm"], meta["bands"], meta["shingle_size"], meta["seed"]
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        # Multiply-shift hashing with wrapping uint64 arithmetic: random odd multipliers combine
+        # word hashes into shingle hashes, permute those, and fold a band's slots into one key
+        rng = np.random.default_rng(seed)
+        self._combine = _odd_u64(rng, shingle_size)
+        self._a = _odd_u64(rng, num_perm)
+        self._b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        self._fold = _odd_u64(rng, self.rows)
+
+        self._count = meta["count"] if meta is not None else 0
+        self._doc_ids: List[str] = self._load_doc_ids()
+        self._signatures = self._open_array("signatures.u32", np.uint32, num_perm, max(self._count, 1024))
+        self._band_keys = self._open_array("bands.u64", np.uint64, bands, max(self._count, 1024))
+        # Rows [0, _sorted_upto) are searched through the sorted band tables (one row per band);
+        # newer rows through dicts until the next rebuild
+        self._sorted_upto = 0
+        self._sorted_keys = np.empty((bands, 0), dtype=np.uint64)
+        self._sorted_rows = np.empty((bands, 0), dtype=np.int64)
+        self._recent: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        if not self._open_sorted(meta.get("sorted_upto", 0) if meta is not None else 0):
+            self._rebuild()
+
+    # Storage
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load_meta(self) -> Optional[dict]:
+        if self.path is None or not os.path.exists(self._file("meta.json")):
+            return None
+        with open(self._file("meta.json")) as f:
+            return json.load(f)
+
+    def _load_doc_ids(self) -> List[str]:
+        if self.path is None or not os.path.exists(self._file("ids.jsonl")):
+            return []
+        with open(self._file("ids.jsonl")) as f:
+            return [json.loads(line) for line in f][:self._count]
+
+    def _open_array(self, name: str, dtype: type, width: int, capacity: int) -> np.ndarray:
+        if self.path is None:
+            return np.zeros((capacity, width), dtype=dtype)
+        os.makedirs(self.path, exist_ok=True)
+        file = self._file(name)
+        size = capacity * width * np.dtype(dtype).itemsize
+        if not os.path.exists(file) or os.path.getsize(file) < size:
+            with open(file, "ab") as f:
+                f.truncate(size)
+        capacity = os.path.getsize(file) // (width * np.dtype(dtype).itemsize)
+        return np.memmap(file, dtype=dtype, mode="r+", shape=(capacity, width))
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._signatures)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        if self.path is None:
+            extra = capacity - len(self._signatures)
+            self._signatures = np.concatenate([self._signatures, np.zeros((extra, self.num_perm), np.uint32)])
+            self._band_keys = np.concatenate([self._band_keys, np.zeros((extra, self.bands), np.uint64)])
+            return
+        self.flush()
+        self._signatures = self._open_array("signatures.u32", np.uint32, self.num_perm, capacity)
+        self._band_keys = self._open_array("bands.u64", np.uint64, self.bands, capacity)
+
+    def flush(self) -> None:
+        """Write pending signatures and metadata to disk (a no-op in memory)."""
+        if self.path is None:
+            return
+        self._signatures.flush()
+        self._band_keys.flush()
+        meta = {
+            "num_perm": self.num_perm, "bands": self.bands, "shingle_size": self.shingle_size,
+            "seed": self.seed, "count": self._count, "sorted_upto": self._sorted_upto,
+        }
+        with open(self._file("meta.json") + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(self._file("meta.json") + ".tmp", self._file("meta.json"))
+
+    # LSH tables
+    def _map_sorted(self, suffix: str, n: int, mode: str) -> Tuple[np.ndarray, np.ndarray]:
+        keys = np.memmap(self._file("sorted_keys.u64" + suffix), dtype=np.uint64, mode=mode, shape=(self.bands, n))
+        rows = np.memmap(self._file("sorted_rows.i64" + suffix), dtype=np.int64, mode=mode, shape=(self.bands, n))
+        return keys, rows
+
+    def _open_sorted(self, sorted_upto: int) -> bool:
+        """Map the band tables saved by the last rebuild; False if there are none to map."""
+        if self.path is None or not sorted_upto:
+            return False
+        size = self.bands * sorted_upto * 8
+        files = [self._file("sorted_keys.u64"), self._file("sorted_rows.i64")]
+        if not all(os.path.exists(f) and os.path.getsize(f) == size for f in files):
+            return False
+        self._sorted_keys, self._sorted_rows = self._map_sorted("", sorted_upto, "r")
+        self._sorted_upto = sorted_upto
+        for row in range(sorted_upto, self._count):
+            for band, key in enumerate(self._band_keys[row]):
+                self._recent[band].setdefault(int(key), []).append(row)
+        return True
+
+    def _rebuild(self) -> None:
+        # One band column is sorted in memory at a time; the tables themselves live on disk
+        n = self._count
+        if self.path is None or n == 0:
+            keys = np.empty((self.bands, n), dtype=np.uint64)
+            rows = np.empty((self.bands, n), dtype=np.int64)
+        else:
+            keys, rows = self._map_sorted(".tmp", n, "w+")
+        for band in range(self.bands):
+            column = np.array(self._band_keys[:n, band])
+            order = np.argsort(column, kind="stable")
+            keys[band] = column[order]
+            rows[band] = order
+        if self.path is not None and n:
+            keys.flush()
+            rows.flush()
+            del keys, rows
+            self._sorted_keys = self._sorted_rows = None  # Unmap the old tables before replacing them
+            for name in ("sorted_keys.u64", "sorted_rows.i64"):
+                os.replace(self._file(name + ".tmp"), self._file(name))
+            keys, rows = self._map_sorted("", n, "r")
+        self._sorted_keys, self._sorted_rows = keys, rows
+        self._sorted_upto = n
+        self._recent = [{} for _ in range(self.bands)]
+        self.flush()
+
+    def _candidates(self, band_keys: np.ndarray) -> np.ndarray:
+        found = []
+        for band, key in enumerate(band_keys):
+            keys = self._sorted_keys[band]
+            lo, hi = np.searchsorted(keys, key, "left"), np.searchsorted(keys, key, "right")
+            if hi > lo:
+                found.append(self._sorted_rows[band][lo:hi])
+            recent = self._recent[band].get(int(key))
+            if recent:
+                found.append(np.asarray(recent))
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    # Signatures
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.lower())
+        if not words:
+            return np.full(self.num_perm, _EMPTY, dtype=np.uint32)
+        # Hash each word once; a shingle's hash is a weighted sum of its words' hashes
+        word_hashes = np.fromiter((zlib.crc32(w.encode()) for w in words), dtype=np.uint64, count=len(words))
+        size = min(self.shingle_size, len(words))
+        n = len(words) - size + 1
+        hashes = np.zeros(n, dtype=np.uint64)
+        for offset in range(size):
+            hashes += word_hashes[offset:offset + n] * self._combine[offset]
+        permuted = (self._a[:, None] * np.unique(hashes)[None, :] + self._b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys_of(self, signatures: np.ndarray) -> np.ndarray:
+        grouped = signatures.reshape(len(signatures), self.bands, self.rows).astype(np.uint64)
+        return (grouped * self._fold).sum(axis=2, dtype=np.uint64)
+
+    # Public API
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, doc_id: str, text: str) -> int:
+        return self.add_many([(doc_id, text)])
+
+    def add_many(self, docs: Iterable[Tuple[str, str]]) -> int:
+        """Index `(doc_id, text)` pairs; returns how many were added."""
+        docs = list(docs)
+        if not docs:
+            return 0
+        signatures = np.stack([self.signature(text) for _, text in docs])
+        band_keys = self._band_keys_of(signatures)
+        start = self._count
+        self._grow(start + len(docs))
+        self._signatures[start:start + len(docs)] = signatures
+        self._band_keys[start:start + len(docs)] = band_keys
+        for offset, keys in enumerate(band_keys):
+            for band, key in enumerate(keys):
+                self._recent[band].setdefault(int(key), []).append(start + offset)
+        self._count += len(docs)
+        self._doc_ids.extend(doc_id for doc_id, _ in docs)
+        if self.path is not None:
+            with open(self._file("ids.jsonl"), "a") as f:
+                f.writelines(json.dumps(doc_id) + "\n" for doc_id, _ in docs)
+            self.flush()
+        # Fold new rows into the sorted tables once they are a sizeable share of the corpus
+        if self._count - self._sorted_upto > max(1024, self._sorted_upto // 8):
+            self._rebuild()
+        return len(docs)
+
+    def nearest(self, text: str, k: int = 5, min_similarity: float = 0.0) -> List[Match]:
+        """The `k` most similar indexed posts among the LSH candidates, most similar first."""
+        signature = self.signature(text)
+        if (signature == _EMPTY).all():
+            return []
+        rows = self._candidates(self._band_keys_of(signature[None, :])[0])
+        if not len(rows):
+            return []
+        similarity = (np.asarray(self._signatures[rows]) == signature).mean(axis=1)
+        best = np.argsort(-similarity, kind="stable")[:k]
+        return [
+            Match(self._doc_ids[rows[i]], round(float(similarity[i]), 4))
+            for i in best if similarity[i] >= min_similarity
+        ]
+
+    def originality(self, text: str) -> float:
+        """1 minus the similarity of the closest indexed post; 1.0 when nothing is close."""
+        matches = self.nearest(text, k=1)
+        return round(1.0 - matches[0].similarity, 4) if matches else 1.0
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Add published posts (text/markdown files) to an originality index.")
+    parser.add_argument("index", help="Index directory")
+    parser.add_argument("files", nargs="+", help="Files or glob patterns")
+    args = parser.parse_args()
+
+    index = OriginalityIndex(args.index)
+    paths = [p for pattern in args.files for p in sorted(glob.glob(pattern))]
+    docs = []
+    for p in paths:
+        with open(p, encoding="utf-8") as f:
+            docs.append((p, f.read()))
+    index.add_many(docs)
+    print(f"Indexed {len(docs)} posts; {len(index)} in {args.index}")
@@ -0,0 +1,303 @@
+"""Repair structured outputs locally before pydantic-ai asks the model to try again.
+
+A small model often returns a result that is nearly right: a score of 11 on a 0-10 scale,
+"8/10" where an integer is expected, the JSON in a text reply wrapped in prose or a code fence
+instead of a result tool call, or the arguments nested under an extra key. Each of these costs
+a full generation when it reaches validation. `RepairingModel` wraps a model and fixes such
+result tool calls against their JSON schema before the agent validates them:
+
+    model = RepairingModel(OllamaModel(...))
+
+Repairs are conservative: numbers are parsed and clamped to the schema's bounds, lone values
+are wrapped into lists, over-long lists and strings are truncated, enum values are matched
+case-insensitively, and JSON is extracted from surrounding text. Anything still invalid goes back
+to the model as before. Those retry prompts are shortened to the failing fields and messages,
+instead of a JSON dump that echoes every input back. `stats` tracks responses, repairs, kinds of
+fix and retries per result schema.
+"""
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import json
+import re
+
+from pydantic_ai.messages import (
+    ArgsJson,
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    RetryPromptPart,
+    TextPart,
+    ToolCallPart,
+)
+from pydantic_ai.models import AgentModel, EitherStreamedResponse, Model
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.usage import Usage
+
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+def extract_json(text: str) -> Any:
+    """The first JSON object or array in `text` (code fences and surrounding prose ignored), or None."""
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[\[{]", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        return value
+    return None
+
+
+def schema_name(tool: ToolDefinition) -> str:
+    """Name of the type a result tool returns, e.g. 'EvaluatorOutput' or 'List[OCRResult]'."""
+    schema = tool.parameters_json_schema
+    if tool.outer_typed_dict_key is None:
+        return schema.get("title", "object")
+    inner = schema["properties"][tool.outer_typed_dict_key]
+    if inner.get("type") == "array" and "$ref" in inner.get("items", {}):
+        return f"List[{inner['items']['$ref'].rsplit('/', 1)[-1]}]"
+    return inner.get("title", inner.get("type", "object"))
+
+
+def _resolve(schema: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    while "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    return schema
+
+
+def repair_value(value: Any, schema: Dict[str, Any], defs: Dict[str, Any], fixes: List[str]) -> Any:
+    """Coerce `value` towards `schema`, appending a "kind" entry to `fixes` for each change."""
+    schema = _resolve(schema, defs)
+    if "anyOf" in schema:
+        options = [s for s in schema["anyOf"] if s.get("type") != "null"]
+        if value is None or len(options) != 1:
+            return value
+        schema = _resolve(options[0], defs)
+    kind = schema.get("type")
+
+    if isinstance(value, str) and kind in ("object", "array"):
+        parsed = extract_json(value)
+        if isinstance(parsed, dict if kind == "object" else list):
+            fixes.append("json_from_text")
+            value = parsed
+
+    if kind == "object" and isinstance(value, dict):
+        properties = schema.get("properties", {})
+        if properties and len(value) == 1 and not set(value) & set(properties):
+            (inner,) = value.values()
+            if isinstance(inner, dict) and set(inner) & set(properties):
+                fixes.append("unwrapped")
+                value = inner
+        return {
+            key: repair_value(item, properties[key], defs, fixes) if key in properties else item
+            for key, item in value.items()
+        }
+
+    if kind == "array":
+        if value is not None and not isinstance(value, list):
+            fixes.append("wrapped_in_list")
+            value = [value]
+        if isinstance(value, list):
+            if "maxItems" in schema and len(value) > schema["maxItems"]:
+                fixes.append("truncated")
+                value = value[:schema["maxItems"]]
+            items = schema.get("items", {})
+            value = [repair_value(item, items, defs, fixes) for item in value]
+        return value
+
+    if kind in ("integer", "number"):
+        if isinstance(value, str):
+            match = _NUMBER.search(value)
+            if match is None:
+                return value
+            fixes.append("parsed_number")
+            value = float(match.group())
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return value
+        if kind == "integer" and not float(value).is_integer():
+            fixes.append("rounded")
+        if kind == "integer":
+            value = int(round(value))
+        low, high = schema.get("minimum"), schema.get("maximum")
+        if kind == "integer" and low is None and "exclusiveMinimum" in schema:
+            low = schema["exclusiveMinimum"] + 1
+        if kind == "integer" and high is None and "exclusiveMaximum" in schema:
+            high = schema["exclusiveMaximum"] - 1
+        if low is not None and value < low:
+            fixes.append("clamped")
+            value = low
+        if high is not None and value > high:
+            fixes.append("clamped")
+            value = high
+        return value
+
+    if kind == "string":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            fixes.append("stringified")
+            value = str(value)
+        if isinstance(value, str):
+            if "enum" in schema and value not in schema["enum"]:
+                matches = [e for e in schema["enum"] if isinstance(e, str) and e.lower() == value.strip().lower()]
+                if matches:
+                    fixes.append("enum_case")
+                    value = matches[0]
+            if "maxLength" in schema and len(value) > schema["maxLength"]:
+                fixes.append("truncated")
+                value = value[:schema["maxLength"]]
+        return value
+
+    return value
+
+
+def compact_retry(part: RetryPromptPart) -> RetryPromptPart:
+    """Name only the failing fields and messages, without echoing the rejected input back."""
+    if isinstance(part.content, str):
+        return part
+    lines = []
+    for error in part.content:
+        location = ".".join(str(p) for p in error.get("loc", ())) or "result"
+        lines.append(f"- {location}: {error.get('msg', 'invalid')}")
+    content = f"Invalid fields in {part.tool_name or 'the result'}:\n" + "\n".join(lines)
+    return RetryPromptPart(content, tool_name=part.tool_name, tool_call_id=part.tool_call_id, timestamp=part.timestamp)
+
+
+@dataclass
+class SchemaRepairStats:
+    responses: int = 0  # Result tool calls (or JSON text replies) seen
+    repaired: int = 0  # Of those, how many needed a local fix
+    retries: int = 0  # Validation retries still sent back to the model
+    fixes: Counter = field(default_factory=Counter)
+
+    @property
+    def repair_rate(self) -> float:
+        return self.repaired / self.responses if self.responses else 0.0
+
+    @property
+    def retry_rate(self) -> float:
+        return self.retries / self.responses if self.responses else 0.0
+
+
+class RepairingModel(Model):
+    """Wrap a model so result tool calls are repaired against their schema before validation."""
+
+    def __init__(self, model: Model):
+        self.model = model
+        self.stats: Dict[str, SchemaRepairStats] = {}
+
+    async def agent_model(
+        self,
+        *,
+        function_tools: List[ToolDefinition],
+        allow_text_result: bool,
+        result_tools: List[ToolDefinition],
+    ) -> AgentModel:
+        inner = await self.model.agent_model(
+            function_tools=function_tools, allow_text_result=allow_text_result, result_tools=result_tools
+        )
+        return RepairingAgentModel(inner, self, allow_text_result, result_tools)
+
+    def name(self) -> str:
+        return self.model.name()
+
+    def schema_stats(self, name: str) -> SchemaRepairStats:
+        return self.stats.setdefault(name, SchemaRepairStats())
+
+
+class RepairingAgentModel(AgentModel):
+    def __init__(self, inner: AgentModel, owner: RepairingModel, allow_text_result: bool, result_tools: List[ToolDefinition]):
+        self.inner = inner
+        self.owner = owner
+        self.allow_text_result = allow_text_result
+        self.result_tools = {tool.name: tool for tool in result_tools}
+
+    def _outgoing(self, messages: List[ModelMessage]) -> List[ModelMessage]:
+        if not messages or not isinstance(messages[-1], ModelRequest):
+            return messages
+        last = messages[-1]
+        if not any(isinstance(p, RetryPromptPart) for p in last.parts):
+            return messages
+        parts = []
+        for part in last.parts:
+            if isinstance(part, RetryPromptPart) and part.tool_name in self.result_tools:
+                self.owner.schema_stats(schema_name(self.result_tools[part.tool_name])).retries += 1
+                part = compact_retry(part)
+            parts.append(part)
+        return [*messages[:-1], ModelRequest(parts)]
+
+    def _repair_call(self, part: ToolCallPart, tool: ToolDefinition, fixes: Optional[List[str]] = None) -> ToolCallPart:
+        stats = self.owner.schema_stats(schema_name(tool))
+        stats.responses += 1
+        fixes = fixes or []
+        if isinstance(part.args, ArgsJson):
+            try:
+                args = json.loads(part.args.args_json)
+            except ValueError:
+                args = extract_json(part.args.args_json)
+                if args is None:
+                    return part  # Nothing to salvage; leave it to the retry
+                fixes.append("json_from_text")
+        else:
+            args = part.args.args_dict
+        if tool.outer_typed_dict_key is not None and not (isinstance(args, dict) and tool.outer_typed_dict_key in args):
+            fixes.append("wrapped_in_result_key")
+            args = {tool.outer_typed_dict_key: args}
+        if not isinstance(args, dict):
+            return part
+        schema = tool.parameters_json_schema
+        args = repair_value(args, schema, schema.get("$defs", {}), fixes)
+        if not fixes:
+            return part
+        stats.repaired += 1
+        stats.fixes.update(fixes)
+        return ToolCallPart.from_raw_args(part.tool_name, args, part.tool_call_id)
+
+    def _repair(self, response: ModelResponse) -> ModelResponse:
+        calls = [p for p in response.parts if isinstance(p, ToolCallPart)]
+        if not calls and not self.allow_text_result and len(self.result_tools) == 1:
+            # A JSON answer sent as text rather than as a result tool call: turn it into the call
+            (tool,) = self.result_tools.values()
+            text = "".join(p.content for p in response.parts if isinstance(p, TextPart))
+            value = extract_json(text)
+            if value is not None:
+                call = self._repair_call(
+                    ToolCallPart.from_raw_args(tool.name, json.dumps(value)), tool, ["text_to_tool_call"]
+                )
+                return ModelResponse([*response.parts, call], timestamp=response.timestamp)
+            return response
+        parts = [
+            self._repair_call(p, self.result_tools[p.tool_name])
+            if isinstance(p, ToolCallPart) and p.tool_name in self.result_tools else p
+            for p in response.parts
+        ]
+        return ModelResponse(parts, timestamp=response.timestamp)
+
+    async def request(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> Tuple[ModelResponse, Usage]:
+        response, usage = await self.inner.request(self._outgoing(messages), model_settings)
+        return self._repair(response), usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> AsyncIterator[EitherStreamedResponse]:
+        async with self.inner.request_stream(self._outgoing(messages), model_settings) as response:
+            yield response
+
+
+def format_stats(stats: Dict[str, SchemaRepairStats]) -> str:
+    lines = []
+    for name, s in sorted(stats.items()):
+        fixes = ", ".join(f"{kind}={n}" for kind, n in s.fixes.most_common()) or "none"
+        lines.append(
+            f"{name}: {s.responses} responses, {s.repair_rate:.0%} repaired, {s.retry_rate:.0%} retried ({fixes})"
+        )
+    return "\n".join(lines)
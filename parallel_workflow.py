@@ -1,13 +1,17 @@
 from dataclasses import dataclass
-from typing import List
+from typing import AsyncIterator, List, Optional
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.ollama import OllamaModel
-import asyncio
-import nest_asyncio
+from pydantic_ai.usage import Usage
 
-
-nest_asyncio.apply()
+from admission import AdmittedModel, Priority, priority
+from batch_runner import BatchResult, BatchSummary, run_batch, stream_batch
+from checkpoint import CheckpointJournal, checkpointed
+from model_pool import ModelPool
+from singleflight import coalesce_runs
+from structured_stream import stream_list_items
+from instrumentation import instrument_from_env
+import runtime
 
 
 # Define the Pydantic model for the structured response
@@ -20,11 +24,9 @@ class QualityReport(BaseModel):
 class DatasetAnalysisDependencies:
     datasets: List[str]
 
-# Instantiate the model
-model = OllamaModel(
-    model_name='qwen2.5:7b',
-    base_url='http://localhost:11434/v1/',
-)
+# Instantiate the model; set OLLAMA_BASE_URLS=url1,url2,... to spread datasets over several replicas.
+# Requests pass the shared admission controller (MODEL_MAX_RPS / MODEL_MAX_TPS / MODEL_MAX_CONCURRENCY)
+model = AdmittedModel(ModelPool.from_env('qwen2.5:7b'))
 
 # Create the agent
 agent = Agent(
@@ -36,6 +38,12 @@ agent = Agent(
     ),
 )
 
+# Duplicate dataset names in flight at the same time share a single analysis run
+dataset_runs = coalesce_runs(agent)
+
+# Record spans for every run when AGENT_TRACE_FILE is set
+instrument_from_env(dataset_agent=agent)
+
 # Define the parallel task executor
 async def analyze_dataset(ctx: RunContext[DatasetAnalysisDependencies], dataset: str) -> QualityReport:
     """Analyze a single dataset for quality issues."""
@@ -45,22 +53,86 @@ async def analyze_dataset(ctx: RunContext[DatasetAnalysisDependencies], dataset:
     )
     return response.data
 
-# Define the main function to process datasets in parallel
-async def process_datasets_in_parallel(datasets: List[str]):
+async def stream_dataset_issues(dataset: str) -> AsyncIterator[str]:
+    """Yield each issue for one dataset as soon as the model has written it."""
+    async for issue in stream_list_items(
+        agent,
+        f"Analyze the dataset '{dataset}' for quality issues.",
+        str,
+        field="issues_found",
+        deps=DatasetAnalysisDependencies(datasets=[dataset]),
+    ):
+        yield issue
+
+# Bounded concurrency so a large sweep doesn't flood the single Ollama server
+MAX_CONCURRENCY = 8
+# Per-dataset timeout in seconds; a stuck run is reported as a failure instead of stalling the batch
+DATASET_TIMEOUT = 120.0
+# Set CHECKPOINT_DIR to journal finished reports, so a restarted sweep skips datasets already analyzed
+journal = CheckpointJournal.from_env("parallel_workflow")
+
+
+def _dataset_worker(datasets: List[str], journal: Optional[CheckpointJournal] = None):
     deps = DatasetAnalysisDependencies(datasets=datasets)
-    tasks = [
-        analyze_dataset(RunContext(deps), dataset) for dataset in datasets
-    ]
-    return await asyncio.gather(*tasks)
+    ctx = RunContext(deps, model, Usage(), prompt="")
+
+    async def worker(dataset: str) -> QualityReport:
+        # Sweeps queue behind interactive and normal requests for the model server
+        with priority(Priority.BATCH):
+            return await checkpointed(
+                journal, dataset, "quality_report", QualityReport, lambda: analyze_dataset(ctx, dataset)
+            )
+
+    return worker
+
+
+async def stream_dataset_reports(
+    datasets: List[str],
+    max_concurrency: int = MAX_CONCURRENCY,
+    timeout: Optional[float] = DATASET_TIMEOUT,
+    journal: Optional[CheckpointJournal] = None,
+) -> AsyncIterator[BatchResult[str, QualityReport]]:
+    """Yield one result per dataset as soon as its analysis completes (or fails)."""
+    async for entry in stream_batch(
+        datasets, _dataset_worker(datasets, journal), max_concurrency=max_concurrency, timeout=timeout
+    ):
+        yield entry
+
+
+# Define the main function to process datasets in parallel
+async def process_datasets_in_parallel(
+    datasets: List[str],
+    max_concurrency: int = MAX_CONCURRENCY,
+    timeout: Optional[float] = DATASET_TIMEOUT,
+    journal: Optional[CheckpointJournal] = None,
+) -> BatchSummary[str, QualityReport]:
+    """Analyze all datasets with bounded concurrency, collecting failures instead of raising.
+
+    With a `journal`, datasets analyzed by an earlier (crashed) run are taken from it.
+    """
+    return await run_batch(
+        datasets, _dataset_worker(datasets, journal), max_concurrency=max_concurrency, timeout=timeout
+    )
 
 # Example datasets for analysis
 datasets_to_analyze = ["Dataset A", "Dataset B", "Dataset C"]
 
 # Run the parallel analysis
 async def main():
-    results = await process_datasets_in_parallel(datasets_to_analyze)
-    for result in results:
-        print(result.json(indent=2))
+    try:
+        summary = await process_datasets_in_parallel(datasets_to_analyze, journal=journal)
+        for report in summary.values:
+            print(report.model_dump_json(indent=2))
+        for failure in summary.failures:
+            print(f"Failed to analyze {failure.item}: {failure.error!r}")
+        print(f"Coalesced runs: {dataset_runs.stats}")
+        if journal is not None:
+            print(f"Checkpoints: {journal.stats}")
+            if not summary.failures:
+                journal.complete()  # Keep the journal only while some datasets still need a rerun
+    finally:
+        if journal is not None:
+            journal.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    runtime.run(main())
\ No newline at end of file
@@ -0,0 +1,44 @@
+from dataclasses import asdict, is_dataclass
+from string import Formatter
+from typing import Any, Tuple
+import inspect
+import json
+
+from pydantic import BaseModel
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    return str(value)
+
+
+def fingerprint(values: Any) -> str:
+    """Stable text fingerprint of the values a prompt is rendered from."""
+    return json.dumps(values, sort_keys=True, default=_jsonable, separators=(",", ":"))
+
+
+class PromptTemplate:
+    """A `str.format` system prompt template, parsed once.
+
+    Put the fixed instructions first: `prefix` (the text before the first field) is then the
+    same for every deps value, which lets a local model server reuse its prompt cache across
+    calls. Rendering is a plain `format_map`; memoizing it would cost as much as the formatting.
+    """
+
+    def __init__(self, template: str):
+        self.template = inspect.cleandoc(template)
+        parsed = list(Formatter().parse(self.template))
+        self.prefix = parsed[0][0] if parsed and parsed[0][1] is not None else self.template
+        # Top-level names only: "{deps.name}" and "{items[0]}" both need "deps"/"items"
+        names = [field.split(".")[0].split("[")[0] for _, field, _, _ in parsed if field]
+        self.fields: Tuple[str, ...] = tuple(dict.fromkeys(names))
+
+    def render(self, **values: Any) -> str:
+        return self.template.format_map(values)
+
+    def render_from(self, deps: Any) -> str:
+        """Render with the template's fields read as attributes of `deps` (e.g. `ctx.deps`)."""
+        return self.render(**{name: getattr(deps, name) for name in self.fields})
@@ -0,0 +1,276 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models import AgentModel, EitherStreamedResponse, Model
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from pydantic_ai.usage import Usage
+
+
+_MISSING = object()
+
+# Set by CachedAgentModel.request so wrappers awaiting it (e.g. instrumentation) can tell hits apart
+served_from_cache: ContextVar[bool] = ContextVar("served_from_cache", default=False)
+
+
+# In-memory tier: LRU ordering plus an optional time-to-live per entry
+class TTLCache:
+    """A small LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value; `ttl` overrides the cache-wide default for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# On-disk tier: survives restarts so a rerun of a pipeline can reuse earlier responses
+class SQLiteCacheTier:
+    """String key/value store in a single SQLite table, with optional expiry."""
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.invalidate(key)
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = None if self.ttl is None else time.time() + self.ttl
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+
+    def invalidate(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    disk_hits: int = 0  # Subset of hits that were served by the SQLite tier
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResponseCache:
+    """Content-addressed cache: memory (LRU + TTL) in front of an optional SQLite file."""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        self.memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.disk = SQLiteCacheTier(path, ttl=ttl) if path else None
+        self.stats = CacheStats()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash any JSON-serialisable parts into a stable cache key."""
+        payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)  # Promote so the next lookup stays in memory
+                self.stats.disk_hits += 1
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def default_response_cache() -> ResponseCache:
+    """Process-wide cache shared by every script; set AGENT_RESPONSE_CACHE to a path to persist it."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(
+            max_entries=int(os.getenv("AGENT_RESPONSE_CACHE_SIZE", "1024")),
+            path=os.getenv("AGENT_RESPONSE_CACHE") or None,
+        )
+    return _default_cache
+
+
+def _strip_timestamps(value: Any) -> Any:
+    # Timestamps change on every run and would make every key unique
+    if isinstance(value, dict):
+        return {k: _strip_timestamps(v) for k, v in value.items() if k != "timestamp"}
+    if isinstance(value, list):
+        return [_strip_timestamps(v) for v in value]
+    return value
+
+
+def _tool_defs(tools: List[ToolDefinition]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "name": t.name,
+            "description": t.description,
+            "parameters": t.parameters_json_schema,
+            "outer_typed_dict_key": t.outer_typed_dict_key,
+        }
+        for t in tools
+    ]
+
+
+# Model wrapper: sits between an agent and the real model
+class CachedModel(Model):
+    """Serve repeated model requests from a `ResponseCache`.
+
+    The key covers the model name, every message sent (system prompts with the rendered deps,
+    user prompt, earlier tool calls and returns), the function tools and the result tool
+    JSON schema, so a hit is only possible when the model would see exactly the same request.
+    Streaming requests are passed straight through.
+    """
+
+    def __init__(self, model: Model, cache: Optional[ResponseCache] = None):
+        self.model = model
+        self.cache = cache if cache is not None else default_response_cache()
+
+    async def agent_model(
+        self,
+        *,
+        function_tools: List[ToolDefinition],
+        allow_text_result: bool,
+        result_tools: List[ToolDefinition],
+    ) -> AgentModel:
+        inner = await self.model.agent_model(
+            function_tools=function_tools,
+            allow_text_result=allow_text_result,
+            result_tools=result_tools,
+        )
+        scope = {
+            "model": self.model.name(),
+            "function_tools": _tool_defs(function_tools),
+            "result_tools": _tool_defs(result_tools),
+            "allow_text_result": allow_text_result,
+        }
+        return CachedAgentModel(inner, self.cache, scope)
+
+    def name(self) -> str:
+        return self.model.name()
+
+
+class CachedAgentModel(AgentModel):
+    def __init__(self, inner: AgentModel, cache: ResponseCache, scope: Dict[str, Any]):
+        self.inner = inner
+        self.cache = cache
+        self.scope = scope
+
+    def cache_key(self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]) -> str:
+        rendered = _strip_timestamps(ModelMessagesTypeAdapter.dump_python(messages, mode="json"))
+        return self.cache.make_key(self.scope, rendered, dict(model_settings or {}))
+
+    async def request(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> Tuple[ModelResponse, Usage]:
+        key = self.cache_key(messages, model_settings)
+        cached = self.cache.get(key)
+        served_from_cache.set(cached is not None)
+        if cached is not None:
+            response = ModelMessagesTypeAdapter.validate_json(cached)[0]
+            return response, Usage()  # Already paid for; no new tokens spent
+        response, usage = await self.inner.request(messages, model_settings)
+        self.cache.set(key, ModelMessagesTypeAdapter.dump_json([response]).decode())
+        return response, usage
+
+    @asynccontextmanager
+    async def request_stream(
+        self, messages: List[ModelMessage], model_settings: Optional[ModelSettings]
+    ) -> AsyncIterator[EitherStreamedResponse]:
+        async with self.inner.request_stream(messages, model_settings) as response:
+            yield response
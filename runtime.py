@@ -0,0 +1,104 @@
+"""One long-lived background event loop for synchronous callers.
+
+`Agent.run_sync` starts the event loop afresh and blocks on it for every call. Inside a running
+loop (Jupyter, an async service), that only works after `nest_asyncio.apply()` patches asyncio
+globally. Instead, async code awaits `agent.run(...)` directly, and sync code submits coroutines
+to a single loop running in a daemon thread:
+
+    from runtime import run, submit
+
+    result = run(agent.run("Describe the product.", deps=deps))     # blocks, returns RunResult
+    future = submit(agent.run("Describe the product.", deps=deps))  # concurrent.futures.Future
+    summary = run(sessions.run(agent, session_id, "Any open invoices?", deps=deps))
+
+The workflow scripts start their async `main()` the same way (`runtime.run(main())`). Because
+every sync call shares the same loop, its connection pools, caches and loop-bound primitives
+(semaphores, coalescing futures) are reused across calls. `submit` is thread-safe, so worker
+threads can share the loop as well.
+"""
+from concurrent.futures import Future
+from typing import Awaitable, Optional, TypeVar
+import asyncio
+import atexit
+import threading
+
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    """An event loop running forever in a daemon thread, started on first use."""
+
+    def __init__(self, name: str = "agent-runtime"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve() -> None:
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, coro: Awaitable[T]) -> "Future[T]":
+        """Schedule `coro` on the background loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run `coro` on the background loop and block until it finishes."""
+        if threading.current_thread() is self._thread:
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            raise RuntimeError("run() would deadlock inside the runtime loop; await the coroutine instead")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+
+        async def cancel_pending() -> None:
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(cancel_pending(), loop).result(timeout)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            loop.close()
+
+
+_default = BackgroundLoop()
+atexit.register(_default.shutdown)
+
+
+def submit(coro: Awaitable[T]) -> "Future[T]":
+    return _default.submit(coro)
+
+
+def run(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    return _default.run(coro, timeout)
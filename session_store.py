@@ -0,0 +1,212 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import inspect
+import os
+import time
+import weakref
+
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelMessagesTypeAdapter,
+    ModelRequest,
+    SystemPromptPart,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_ai.result import RunResult
+
+from admission import Priority, priority
+
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+# Summarizer: turns dropped from the history -> short text; may be sync or async
+Summarizer = Callable[[List[ModelMessage]], Any]
+
+
+def estimate_tokens(messages: List[ModelMessage]) -> int:
+    """Rough token count (4 characters per token) of the serialized messages."""
+    return len(ModelMessagesTypeAdapter.dump_json(messages)) // 4
+
+
+def split_turns(messages: List[ModelMessage]) -> Tuple[List[SystemPromptPart], List[List[ModelMessage]]]:
+    """Split a history into its system prompt parts and a list of turns.
+
+    A turn starts at each request carrying a user prompt and includes the tool calls,
+    tool returns and responses that follow, so dropping whole turns never orphans a tool call.
+    """
+    preamble: List[SystemPromptPart] = []
+    turns: List[List[ModelMessage]] = []
+    for message in messages:
+        if isinstance(message, ModelRequest):
+            system = [p for p in message.parts if isinstance(p, SystemPromptPart)]
+            if system:
+                preamble.extend(system)
+                message = ModelRequest([p for p in message.parts if not isinstance(p, SystemPromptPart)])
+            if any(isinstance(p, UserPromptPart) for p in message.parts) or not turns:
+                turns.append([])
+        turns[-1].append(message)
+    return preamble, [turn for turn in turns if turn]
+
+
+def render_transcript(messages: List[ModelMessage]) -> str:
+    """Plain-text transcript of user prompts, tool results and model replies, for summarizing."""
+    lines = []
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, UserPromptPart):
+                lines.append(f"User: {part.content}")
+            elif isinstance(part, SystemPromptPart) and part.content.startswith(SUMMARY_PREFIX):
+                lines.append(part.content)
+            elif isinstance(part, ToolReturnPart):
+                lines.append(f"Tool {part.tool_name}: {part.model_response_str()}")
+            elif isinstance(part, TextPart):
+                lines.append(f"Assistant: {part.content}")
+            elif isinstance(part, ToolCallPart):
+                lines.append(f"Assistant ({part.tool_name}): {part.args_as_json_str()}")
+    return "\n".join(lines)
+
+
+def agent_summarizer(agent: Agent) -> Callable[[List[ModelMessage]], Awaitable[str]]:
+    """Use a (text result) agent to condense dropped turns into a few sentences."""
+    async def summarize(messages: List[ModelMessage]) -> str:
+        result = await agent.run(
+            "Summarize this support conversation in at most five sentences, keeping names, "
+            f"numbers and open issues:\n\n{render_transcript(messages)}"
+        )
+        return str(result.data)
+
+    return summarize
+
+
+async def compact_history(
+    messages: List[ModelMessage],
+    token_budget: int,
+    summarizer: Optional[Summarizer] = None,
+) -> List[ModelMessage]:
+    """Drop the oldest turns until the history fits `token_budget`.
+
+    The system prompt and the latest turn are always kept. With a `summarizer`, the dropped
+    turns (and any previous summary) are replaced by a summary system prompt part.
+    """
+    if estimate_tokens(messages) <= token_budget:
+        return messages
+    preamble, turns = split_turns(messages)
+    previous_summary = [p for p in preamble if p.content.startswith(SUMMARY_PREFIX)]
+    preamble = [p for p in preamble if not p.content.startswith(SUMMARY_PREFIX)]
+
+    def rebuild(kept: List[List[ModelMessage]], summary: List[SystemPromptPart]) -> List[ModelMessage]:
+        flat = [message for turn in kept for message in turn]
+        first = flat[0]
+        flat[0] = ModelRequest([*preamble, *summary, *first.parts])
+        return flat
+
+    dropped = 0
+    while dropped < len(turns) - 1 and estimate_tokens(rebuild(turns[dropped:], previous_summary)) > token_budget:
+        dropped += 1
+    if dropped == 0:
+        return messages
+
+    summary = previous_summary
+    if summarizer is not None:
+        old = [ModelRequest(previous_summary)] if previous_summary else []
+        old += [message for turn in turns[:dropped] for message in turn]
+        text = summarizer(old)
+        if inspect.isawaitable(text):
+            text = await text
+        summary = [SystemPromptPart(SUMMARY_PREFIX + text)]
+    return rebuild(turns[dropped:], summary)
+
+
+class SessionStore:
+    """Per-session message history for multi-turn support conversations.
+
+    Each `run` continues the session's history, then compacts it to `token_budget` so
+    per-turn prompt size (and latency) stays roughly constant. Sessions are written to
+    `directory` after every turn; at most `max_sessions` stay in memory, and the least
+    recently used ones are evicted (they reload from disk on their next turn).
+    """
+
+    def __init__(
+        self,
+        directory: str = ".sessions",
+        token_budget: int = 2000,
+        max_sessions: int = 128,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.directory = directory
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.summarizer = summarizer
+        self._sessions: "OrderedDict[str, List[ModelMessage]]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # Held only while a turn of the session is running or waiting, then dropped
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        name = hashlib.sha256(session_id.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.json")
+
+    def history(self, session_id: str) -> List[ModelMessage]:
+        """The stored messages for a session (empty for a new one)."""
+        if session_id in self._sessions:
+            self._sessions.move_to_end(session_id)
+            return self._sessions[session_id]
+        path = self._path(session_id)
+        messages: List[ModelMessage] = []
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                messages = ModelMessagesTypeAdapter.validate_json(f.read())
+        self._remember(session_id, messages)
+        return messages
+
+    def _remember(self, session_id: str, messages: List[ModelMessage]) -> None:
+        self._sessions[session_id] = messages
+        self._sessions.move_to_end(session_id)
+        self._last_used[session_id] = time.monotonic()
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._last_used.pop(evicted, None)
+
+    def save(self, session_id: str, messages: List[ModelMessage]) -> None:
+        self._remember(session_id, messages)
+        path = self._path(session_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(ModelMessagesTypeAdapter.dump_json(messages))
+        os.replace(tmp, path)  # Atomic, so a crash never leaves a half-written session
+
+    def evict_idle(self, max_idle_seconds: float) -> int:
+        """Drop sessions idle for longer than `max_idle_seconds` from memory; returns how many."""
+        cutoff = time.monotonic() - max_idle_seconds
+        idle = [sid for sid, used in self._last_used.items() if used < cutoff]
+        for session_id in idle:
+            self._sessions.pop(session_id, None)
+            self._last_used.pop(session_id, None)
+        return len(idle)
+
+    def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+        if os.path.exists(self._path(session_id)):
+            os.remove(self._path(session_id))
+
+    async def run(self, agent: Agent, session_id: str, user_prompt: str, **kwargs: Any) -> RunResult:
+        """Run one turn of `session_id` on `agent`; turns of the same session run one at a time."""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        # Someone is waiting on each turn, so its model requests go ahead of batch work
+        async with lock:
+            history = self.history(session_id)
+            with priority(Priority.INTERACTIVE):
+                result = await agent.run(user_prompt, message_history=history or None, **kwargs)
+            messages = await compact_history(result.all_messages(), self.token_budget, self.summarizer)
+            self.save(session_id, messages)
+            return result
@@ -0,0 +1,95 @@
+"""Coalesce identical concurrent agent runs into one execution.
+
+`coalesce_runs(agent)` wraps `agent.run` (and so `run_sync`). While a run is in flight, any
+other run with the same fingerprint (agent, user prompt, deps) waits for it and receives the
+same `RunResult` instead of starting its own model calls. Results are not kept after the run
+finishes; this only absorbs bursts of duplicates (the response cache handles repeats over time).
+A cancelled caller (e.g. a batch timeout) leaves the run going for the others, but when the last
+caller is cancelled the run itself is cancelled, so it stops holding model capacity.
+
+Runs passing `message_history`, `usage`, `usage_limits` or `model` are never coalesced: their
+outcome depends on more than the prompt and deps.
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+import asyncio
+import functools
+
+from pydantic_ai import Agent
+
+from prompt_templates import fingerprint
+
+
+@dataclass
+class SingleFlightStats:
+    started: int = 0  # Executions actually run
+    shared: int = 0  # Callers that joined an execution already in flight
+
+
+class SingleFlight:
+    """At most one in-flight call per key; concurrent callers with the same key share its result."""
+
+    def __init__(self):
+        self._in_flight: Dict[Any, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.stats = SingleFlightStats()
+
+    def _forget(self, key: Any, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # Tasks belong to one event loop, so the loop is part of the key
+        key = (asyncio.get_running_loop(), key)
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats.started += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        else:
+            self.stats.shared += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shielded: one caller being cancelled (e.g. a batch timeout) must not cancel the others
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                # The last caller gave up, so nobody needs the result: stop the run and free its capacity
+                self._forget(key, task)
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+
+_COALESCABLE_KWARGS = {"deps", "model_settings", "infer_name"}
+
+
+def coalesce_runs(
+    agent: Agent,
+    key: Optional[Callable[[str, Any], Hashable]] = None,
+    flight: Optional[SingleFlight] = None,
+) -> SingleFlight:
+    """Share in-flight runs of `agent` between callers with the same prompt and deps.
+
+    `key(user_prompt, deps)` overrides the default fingerprint, for deps holding things that
+    should not be serialized (database handles, per-run memos).
+    """
+    flight = flight or SingleFlight()
+    run = agent.run
+
+    @functools.wraps(run)
+    async def coalesced_run(user_prompt: str, **kwargs: Any):
+        # `run_sync` forwards every argument, mostly as None
+        if not {name for name, value in kwargs.items() if value is not None} <= _COALESCABLE_KWARGS:
+            return await run(user_prompt, **kwargs)
+        deps = kwargs.get("deps")
+        run_key = key(user_prompt, deps) if key is not None else fingerprint([user_prompt, deps])
+        run_key = (id(agent), run_key, fingerprint(kwargs.get("model_settings")))
+        return await flight.do(run_key, lambda: run(user_prompt, **kwargs))
+
+    agent.run = coalesced_run
+    return flight
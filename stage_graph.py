@@ -0,0 +1,136 @@
+"""A small declarative executor for multi-stage agent pipelines.
+
+Each stage is an async function whose parameter names are the values it needs and whose
+`output` names the value it produces. `StageGraph.run` starts every stage as soon as its inputs
+exist, so independent stages run concurrently. `run_many` pushes many items through the graph at
+once; a per-stage concurrency limit lets different items occupy different stages at the same
+time, like an assembly line.
+
+    graph = StageGraph(inputs=["product_description"])
+
+    @graph.stage(output="summary")
+    async def describe(product_description: str) -> ProductSummary: ...
+
+    @graph.stage(output="benefits")
+    async def list_benefits(summary: ProductSummary) -> Benefits: ...
+
+    summary = await graph.run_many([{"product_description": d} for d in catalog])
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, get_type_hints
+import asyncio
+import inspect
+import weakref
+
+from batch_runner import BatchSummary, run_batch
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Awaitable[Any]]
+    inputs: Tuple[str, ...]
+    output: str
+    output_type: Optional[type] = None  # Checked with isinstance when the return annotation is a class
+    concurrency: Optional[int] = None  # Max items in this stage at once (None = unbounded)
+
+
+class StageGraph:
+    """Stages connected by named values; validated when a stage is added."""
+
+    def __init__(self, inputs: Iterable[str] = ()):
+        self.inputs = tuple(inputs)
+        self.stages: List[Stage] = []
+        self._producers: Dict[str, Stage] = {}
+        # Per event loop, stage name -> semaphore (asyncio primitives bind to their loop)
+        self._limits: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def add_stage(
+        self,
+        fn: Callable[..., Awaitable[Any]],
+        output: str,
+        concurrency: Optional[int] = None,
+    ) -> Stage:
+        inputs = tuple(inspect.signature(fn).parameters)
+        known = set(self.inputs) | set(self._producers)
+        missing = [name for name in inputs if name not in known]
+        if missing:
+            # Stages must be added after the stages they depend on, which also rules out cycles
+            raise ValueError(f"Stage {fn.__name__!r} needs {missing}, which no earlier stage produces")
+        if output in known:
+            raise ValueError(f"Value {output!r} is already produced by another stage or is a graph input")
+        output_type = get_type_hints(fn).get("return")
+        stage = Stage(
+            name=fn.__name__,
+            fn=fn,
+            inputs=inputs,
+            output=output,
+            output_type=output_type if isinstance(output_type, type) else None,
+            concurrency=concurrency,
+        )
+        self.stages.append(stage)
+        self._producers[output] = stage
+        return stage
+
+    def stage(self, output: str, concurrency: Optional[int] = None):
+        """Decorator form of `add_stage`."""
+        def decorator(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+            self.add_stage(fn, output, concurrency)
+            return fn
+
+        return decorator
+
+    async def _run_stage(self, stage: Stage, values: Dict[str, Any]) -> Any:
+        if stage.concurrency is not None:
+            loop = asyncio.get_running_loop()
+            limits = self._limits.get(loop)
+            if limits is None:
+                # A semaphore that ever queued a waiter holds its loop, so weak keys alone don't free it
+                for closed in [l for l in self._limits if l.is_closed()]:
+                    del self._limits[closed]
+                limits = self._limits[loop] = {}
+            limit = limits.get(stage.name)
+            if limit is None:
+                limit = limits[stage.name] = asyncio.Semaphore(stage.concurrency)
+            async with limit:
+                result = await stage.fn(**{name: values[name] for name in stage.inputs})
+        else:
+            result = await stage.fn(**{name: values[name] for name in stage.inputs})
+        if stage.output_type is not None and not isinstance(result, stage.output_type):
+            raise TypeError(
+                f"Stage {stage.name!r} returned {type(result).__name__}, expected {stage.output_type.__name__}"
+            )
+        return result
+
+    async def run(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Run every stage once for one item; returns the inputs plus every stage output."""
+        missing = [name for name in self.inputs if name not in inputs]
+        if missing:
+            raise ValueError(f"Missing graph inputs: {missing}")
+        values = dict(inputs)
+        waiting = list(self.stages)
+        running: Dict[asyncio.Task, Stage] = {}
+        try:
+            while waiting or running:
+                for stage in [s for s in waiting if all(name in values for name in s.inputs)]:
+                    waiting.remove(stage)
+                    running[asyncio.ensure_future(self._run_stage(stage, values))] = stage
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    values[running.pop(task).output] = task.result()  # Re-raises a failed stage
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        return values
+
+    async def run_many(
+        self,
+        items: Iterable[Dict[str, Any]],
+        max_concurrency: int = 8,
+        timeout: Optional[float] = None,
+    ) -> BatchSummary:
+        """Pipeline many items through the graph, `max_concurrency` items in flight at once."""
+        return await run_batch(items, self.run, max_concurrency=max_concurrency, timeout=timeout)
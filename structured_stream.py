@@ -0,0 +1,158 @@
+"""Yield the items of a list result while the model is still generating it.
+
+`stream_list_items` runs an agent with `run_stream` and feeds the growing JSON arguments of the
+result tool call to a `JsonListItemParser`. Each element of the target list is validated and
+yielded as soon as its closing bracket, quote or comma arrives, so the first page of a
+`List[OCRResult]` or the first issue in `QualityReport.issues_found` can be acted on while the
+rest is still being written:
+
+    async for page in stream_list_items(ocr_agent, "Extract text.", OCRResult, deps=deps):
+        index(page)
+
+    async for issue in stream_list_items(agent, prompt, str, field="issues_found", deps=deps):
+        print(issue)
+
+Once the stream ends, the full result is validated as usual, and any items the incremental parser
+did not see are yielded then. This covers servers that send tool-call arguments in one chunk
+rather than streaming them, where nothing arrives early but the output is unchanged.
+"""
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple, Type, TypeVar
+import json
+
+from pydantic import TypeAdapter
+from pydantic_ai import Agent
+from pydantic_ai.messages import ToolCallPart
+
+
+T = TypeVar("T")
+
+# pydantic-ai wraps non-object result types (e.g. List[OCRResult]) in {"response": ...}
+WRAPPED_RESULT_KEY = "response"
+
+
+@dataclass
+class _Frame:
+    kind: str  # "object" or "array"
+    path: Tuple[str, ...]  # Object keys leading to this container
+    key: Optional[str] = None  # Current key, for objects
+    expecting_key: bool = True
+
+
+@dataclass
+class JsonListItemParser:
+    """Incremental scanner that extracts complete elements of the array at `path`.
+
+    `feed` takes the whole text received so far (it must only ever grow) and returns the raw
+    JSON values of the elements completed since the previous call.
+    """
+    path: Tuple[str, ...] = ()
+    _pos: int = 0
+    _stack: List[_Frame] = field(default_factory=list)
+    _in_string: bool = False
+    _escaped: bool = False
+    _string_is_key: bool = False
+    _string_start: int = 0
+    _item_start: Optional[int] = None
+    _item_depth: int = 0
+    _item_is_scalar: bool = False
+
+    def _in_target(self) -> bool:
+        return bool(self._stack) and self._stack[-1].kind == "array" and self._stack[-1].path == self.path
+
+    def _start_value(self, i: int, scalar: bool) -> None:
+        if self._in_target() and self._item_start is None:
+            self._item_start = i
+            self._item_depth = len(self._stack)
+            self._item_is_scalar = scalar
+
+    def _end_container_item(self, text: str, i: int, out: List[Any]) -> None:
+        # Called after popping a container: was it a whole element of the target array?
+        if self._item_start is not None and not self._item_is_scalar and len(self._stack) == self._item_depth:
+            out.append(json.loads(text[self._item_start:i + 1]))
+            self._item_start = None
+
+    def _end_scalar_item(self, text: str, end: int, out: List[Any]) -> None:
+        if self._item_start is not None and self._item_is_scalar and len(self._stack) == self._item_depth:
+            raw = text[self._item_start:end].strip()
+            if raw:
+                out.append(json.loads(raw))
+            self._item_start = None
+
+    def feed(self, text: str) -> List[Any]:
+        out: List[Any] = []
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._stack[-1].key = json.loads(text[self._string_start:i + 1])
+                    else:
+                        self._end_scalar_item(text, i + 1, out)
+                continue
+            if ch == '"':
+                top = self._stack[-1] if self._stack else None
+                self._string_is_key = top is not None and top.kind == "object" and top.expecting_key
+                self._in_string = True
+                self._string_start = i
+                if not self._string_is_key:
+                    self._start_value(i, scalar=True)
+            elif ch in "{[":
+                self._start_value(i, scalar=False)
+                parent = self._stack[-1] if self._stack else None
+                path = parent.path + (parent.key,) if parent is not None and parent.kind == "object" else (
+                    parent.path if parent is not None else ()
+                )
+                self._stack.append(_Frame("object" if ch == "{" else "array", path))
+            elif ch in "}]":
+                if ch == "]":
+                    self._end_scalar_item(text, i, out)
+                if self._stack:
+                    self._stack.pop()
+                self._end_container_item(text, i, out)
+            elif ch == ":":
+                if self._stack and self._stack[-1].kind == "object":
+                    self._stack[-1].expecting_key = False
+            elif ch == ",":
+                self._end_scalar_item(text, i, out)
+                if self._stack and self._stack[-1].kind == "object":
+                    self._stack[-1].expecting_key = True
+            elif not ch.isspace():
+                self._start_value(i, scalar=True)  # Number, true, false or null
+        self._pos = len(text)
+        return out
+
+
+async def stream_list_items(
+    agent: Agent,
+    user_prompt: str,
+    item_type: Type[T],
+    field: Optional[str] = None,
+    **kwargs: Any,
+) -> AsyncIterator[T]:
+    """Run `agent` streamed and yield each validated element of its list result as it completes.
+
+    `field` names the list attribute of an object result (e.g. "issues_found"); leave it out when
+    the result type itself is a list.
+    """
+    path: Sequence[str] = (field,) if field is not None else (WRAPPED_RESULT_KEY,)
+    parser = JsonListItemParser(tuple(path))
+    adapter = TypeAdapter(item_type)
+    yielded = 0
+    async with agent.run_stream(user_prompt, **kwargs) as result:
+        async for message, _ in result.stream_structured(debounce_by=None):
+            call = next((p for p in message.parts if isinstance(p, ToolCallPart)), None)
+            if call is None:
+                continue
+            for raw in parser.feed(call.args_as_json_str()):
+                yield adapter.validate_python(raw)
+                yielded += 1
+        data = await result.get_data()
+    items = getattr(data, field) if field is not None else data
+    for item in items[yielded:]:
+        yield item
@@ -0,0 +1,114 @@
+"""ModelPool against two local stub OpenAI-compatible servers."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from pydantic_ai import Agent
+
+from model_pool import ModelPool
+
+
+COMPLETION = {
+    "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "hello"}}],
+    "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4},
+}
+
+
+class StubServer:
+    """Answers chat completions (after `delay` seconds) and /models; `healthy = False` makes both 503."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.healthy = True
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._send(200 if stub.healthy else 503, {"object": "list", "data": []})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stub.hits += 1
+                time.sleep(stub.delay)
+                if stub.healthy:
+                    self._send(200, COMPLETION)
+                else:
+                    self._send(503, {"error": {"message": "unavailable"}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def servers():
+    stubs = [StubServer(delay=0.1), StubServer(delay=0.1)]
+    yield stubs
+    for stub in stubs:
+        stub.close()
+
+
+async def _run(pool: ModelPool, n: int):
+    agent = Agent(model=pool)
+    try:
+        return await asyncio.gather(*(agent.run("hi") for _ in range(n)))
+    finally:
+        await pool.aclose()
+
+
+def test_concurrent_requests_go_to_the_least_outstanding_replica(servers):
+    pool = ModelPool("stub", [s.url for s in servers], max_concurrency=4)
+    results = asyncio.run(_run(pool, 6))
+    assert [r.data for r in results] == ["hello"] * 6
+    assert [s.hits for s in servers] == [3, 3]
+
+
+def test_unhealthy_replica_is_ejected_then_readmitted_by_a_health_check(servers):
+    good, bad = servers
+    bad.healthy = False
+    pool = ModelPool("stub", [good.url, bad.url], eject_after=1, eject_seconds=60)
+
+    async def scenario():
+        agent = Agent(model=pool)
+        try:
+            # Whichever replica is picked first, the request succeeds: a 503 fails over to the other
+            for _ in range(4):
+                assert (await agent.run("hi")).data == "hello"
+            assert bad.hits == 1
+            assert pool.replicas[1].ejected
+
+            bad.healthy = True
+            assert await pool.check_health() == {good.url: True, bad.url: True}
+            assert not pool.replicas[1].ejected
+            await asyncio.gather(*(agent.run("hi") for _ in range(4)))
+        finally:
+            await pool.aclose()
+
+    asyncio.run(scenario())
+    assert bad.hits > 1
+    assert pool.stats()[1]["failures"] == 1
+
+
+def test_http_clients_are_created_on_first_use():
+    pool = ModelPool("stub", ["http://127.0.0.1:1/v1/", "http://127.0.0.1:2/v1/"])
+    assert all(r._http_client is None for r in pool.replicas)
@@ -0,0 +1,66 @@
+from dataclasses import dataclass
+from typing import Sequence
+import numpy as np
+
+
+# Deleting vowels with str.translate and comparing lengths counts them in one C-level pass
+_VOWELS = "aeiouAEIOU"
+_DROP_VOWELS = str.maketrans("", "", _VOWELS)
+
+
+@dataclass
+class TextMetrics:
+    """Per-text metrics for a batch; every field is an array with one entry per text."""
+    word_counts: np.ndarray
+    unique_word_counts: np.ndarray
+    sentence_counts: np.ndarray
+    syllable_counts: np.ndarray  # Vowel count, the same approximation the blog tools always used
+    coherence: np.ndarray  # Unique words / words, rounded to 2 places
+    readability: np.ndarray  # Flesch reading ease clamped to 0-100, rounded to 2 places
+
+    def __len__(self) -> int:
+        return len(self.word_counts)
+
+
+def compute_text_metrics(texts: Sequence[str]) -> TextMetrics:
+    """Tokenize each text once and compute coherence, readability and syllables for the whole batch.
+
+    Empty texts score 0 for both coherence and readability.
+    """
+    n = len(texts)
+    tokens = [text.split() for text in texts]
+    word_counts = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=n)
+    sentence_counts = np.fromiter(
+        (text.count(".") + text.count("!") + text.count("?") for text in texts), dtype=np.int64, count=n
+    )
+    syllable_counts = np.fromiter(
+        (len(text) - len(text.translate(_DROP_VOWELS)) for text in texts), dtype=np.int64, count=n
+    )
+
+    # Hash-based distinct count per token list; sorting the whole batch's strings with np.unique is slower
+    unique_word_counts = np.fromiter((len(set(t)) for t in tokens), dtype=np.int64, count=n)
+
+    has_words = word_counts > 0
+    safe_words = np.maximum(word_counts, 1)
+    coherence = np.where(has_words, unique_word_counts / safe_words, 0.0)
+    readability = (
+        206.835
+        - 1.015 * (word_counts / np.maximum(sentence_counts, 1))
+        - 84.6 * (syllable_counts / safe_words)
+    )
+    readability = np.where(has_words, np.clip(readability, 0, 100), 0.0)
+
+    return TextMetrics(
+        word_counts=word_counts,
+        unique_word_counts=unique_word_counts,
+        sentence_counts=sentence_counts,
+        syllable_counts=syllable_counts,
+        coherence=_round2(coherence),
+        readability=_round2(readability),
+    )
+
+
+def _round2(values: np.ndarray) -> np.ndarray:
+    # Python's round() rather than np.round, which disagrees on halves like 0.975,
+    # so the tools keep returning exactly what they did before
+    return np.fromiter((round(v, 2) for v in values.tolist()), dtype=np.float64, count=len(values))
@@ -0,0 +1,91 @@
+"""Run deterministic tools before the first model call instead of waiting for the model to ask.
+
+A tool marked with `@deterministic` must take no arguments besides the `RunContext` and
+depend only on `ctx.deps`. `prefetch_deterministic_tools(agent)` hides those tools from the
+model and adds a system prompt that runs them all concurrently and lists their results. This saves the request and
+read round trips the model would otherwise spend on each of them. Results are memoized by a
+fingerprint of the deps, so repeated runs with the same deps do not re-run the tools.
+
+    @offer_agent.tool
+    @deterministic
+    async def generate_bonuses(ctx: RunContext[OfferDependencies]) -> list[str]: ...
+
+    prefetch_deterministic_tools(offer_agent)
+
+Call it after the tools are registered and before instrumenting the agent.
+"""
+from typing import Any, Callable, List, Optional
+import asyncio
+import inspect
+import json
+
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.tools import ToolDefinition
+
+from prompt_templates import fingerprint
+from response_cache import CacheStats, TTLCache
+
+
+def deterministic(fn: Callable) -> Callable:
+    """Mark a tool as a pure function of the deps, safe to run ahead of the model."""
+    fn.__deterministic__ = True
+    return fn
+
+
+def is_deterministic(fn: Callable) -> bool:
+    return getattr(fn, "__deterministic__", False)
+
+
+async def _hide(ctx: RunContext[Any], tool_def: ToolDefinition) -> Optional[ToolDefinition]:
+    # The result is already in the system prompt, so the model never needs to call it
+    return None
+
+
+class ToolPrefetcher:
+    """Computes and memoizes the results of an agent's deterministic tools."""
+
+    def __init__(self, tools: List[Any], max_entries: int = 256):
+        self.tools = tools
+        self._results = TTLCache(max_entries=max_entries)
+        self.stats = CacheStats()
+
+    async def _call(self, tool: Any, ctx: RunContext[Any]) -> Any:
+        result = tool.function(ctx) if tool.takes_ctx else tool.function()
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def results(self, ctx: RunContext[Any]) -> str:
+        """Rendered results for `ctx.deps`, as they would have come back from the tool calls."""
+        key = fingerprint(ctx.deps)
+        rendered = self._results.get(key)
+        if rendered is not None:
+            self.stats.hits += 1
+            return rendered
+        self.stats.misses += 1
+        values = await asyncio.gather(*(self._call(tool, ctx) for tool in self.tools))
+        lines = [
+            f"- {tool.name}: {json.dumps(value, default=str)}" for tool, value in zip(self.tools, values)
+        ]
+        rendered = "Results of tools already run for you (do not call them again):\n" + "\n".join(lines)
+        self._results.set(key, rendered)
+        return rendered
+
+
+def prefetch_deterministic_tools(agent: Agent, max_entries: int = 256) -> Optional[ToolPrefetcher]:
+    """Hide the agent's `@deterministic` tools and inject their results as a system prompt."""
+    tools = [
+        tool for tool in agent._function_tools.values()
+        if is_deterministic(tool.function) and not tool._parameters_json_schema.get("properties")
+    ]
+    if not tools:
+        return None
+    prefetcher = ToolPrefetcher(tools, max_entries=max_entries)
+    for tool in tools:
+        tool.prepare = _hide
+
+    async def prefetched_tool_results(ctx: RunContext[Any]) -> str:
+        return await prefetcher.results(ctx)
+
+    agent.system_prompt(prefetched_tool_results)
+    return prefetcher